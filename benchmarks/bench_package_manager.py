@@ -0,0 +1,280 @@
+"""
+Benchmarks for the Cerebro package manager and tool launcher.
+
+Runs each command through the filters' inlet/outlet against in-memory Files/Tools
+tables (see fakes.py) and a generated local package repository, for every
+combination of pre-existing file rows and installed packages. Results are printed
+as JSON so runs can be compared over time:
+
+    python benchmarks/bench_package_manager.py > bench_output.txt
+    python benchmarks/bench_package_manager.py --rows 10,1000 --packages 1,50 --repeat 3
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import fakes
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID = "bench-user"
+# About 4 MB of earlier conversation, for the cost of turns that are not commands
+LONG_HISTORY = [
+    {
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": f"Message {i}: " + "lorem ipsum dolor sit amet " * 750,
+    }
+    for i in range(200)
+]
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_repo(repo_dir: str, package_count: int):
+    """
+    Lay out a repository like the real one, with `package_count` copies of the
+    template package under plugins/ and the applet runtime under src/.
+    """
+    template_dir = os.path.join(ROOT_DIR, "plugins", "template")
+    package_names = [f"bench{i:03d}" for i in range(package_count)]
+    for package_name in package_names:
+        package_dir = os.path.join(repo_dir, "plugins", package_name)
+        os.makedirs(package_dir)
+        for filename in os.listdir(template_dir):
+            with open(os.path.join(template_dir, filename), encoding="utf-8") as f:
+                content = f.read().replace("template", package_name)
+            with open(
+                os.path.join(package_dir, filename.replace("template", package_name)),
+                "w",
+                encoding="utf-8",
+            ) as f:
+                f.write(content)
+
+    os.makedirs(os.path.join(repo_dir, "src"))
+    shutil.copy(
+        os.path.join(ROOT_DIR, "src", "cerebro_applet.py"),
+        os.path.join(repo_dir, "src", "cerebro_applet.py"),
+    )
+    return package_names
+
+
+def seed_files(files, row_count: int):
+    """
+    Fill the file table with uploads that belong to other users.
+    """
+    for i in range(row_count):
+        file_id = str(uuid.uuid4())
+        files.rows[file_id] = fakes.FileModel(
+            id=file_id,
+            user_id=f"user-{i % 100}",
+            filename=f"/app/backend/data/uploads/{file_id}_document{i}.pdf",
+            meta={"name": f"document{i}.pdf"},
+        )
+
+
+class Bench:
+    def __init__(self, cerebro, launcher, files, tools, repo_dir: str):
+        self.files = files
+        self.tools = tools
+        self.package_manager = cerebro.Filter()
+        self.package_manager.valves.package_repo_url = (
+            f"file://{os.path.join(repo_dir, 'plugins')}"
+        )
+        self.package_manager.valves.log_level = "WARNING"
+        self.launcher = launcher.Filter()
+        self.launcher.valves.log_level = "WARNING"
+
+    def command(self, text: str) -> str:
+        user = {"id": USER_ID}
+        # Open WebUI drops chat_id from the body inlet gets, but outlet's body
+        # (from /api/chat/completed) has it along with the whole conversation
+        asyncio.run(
+            self.package_manager.inlet(
+                {"messages": [{"role": "user", "content": text}]}, user
+            )
+        )
+        reply = {
+            "chat_id": "bench",
+            "messages": [
+                {"role": "user", "content": text},
+                {"role": "assistant", "content": ""},
+            ],
+        }
+        self.package_manager.outlet(reply, user)
+        return reply["messages"][-1]["content"]
+
+    def launch(self, text: str) -> str:
+        user = {"id": USER_ID}
+        self.launcher.inlet({"messages": []}, user)
+        reply = {"messages": [{"role": "assistant", "content": text}]}
+        self.launcher.outlet(reply, user)
+        return reply["messages"][-1]["content"]
+
+    def chat(self, history: list) -> str:
+        """
+        Pass an ordinary chat turn, with the given earlier messages, through both
+        filters the way Open WebUI does.
+        """
+        user = {"id": USER_ID}
+        body = {"messages": history + [{"role": "user", "content": "Thanks!"}]}
+        asyncio.run(self.package_manager.inlet(body, user))
+        self.launcher.inlet(body, user)
+        reply = {
+            "chat_id": "bench",
+            "messages": body["messages"]
+            + [{"role": "assistant", "content": "You're welcome."}],
+        }
+        self.launcher.outlet(reply, user)
+        self.package_manager.outlet(reply, user)
+        return reply["messages"][-1]["content"]
+
+    def measure(self, scenario: str, run, repeat: int = 1) -> dict:
+        timings = []
+        file_scans, tool_scans = self.files.scans, self.tools.scans
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = run()
+            timings.append((time.perf_counter() - start) * 1000)
+        return {
+            "scenario": scenario,
+            "repeat": repeat,
+            "median_ms": round(statistics.median(timings), 3),
+            "min_ms": round(min(timings), 3),
+            "max_ms": round(max(timings), 3),
+            "file_scans": (self.files.scans - file_scans) / repeat,
+            "tool_scans": (self.tools.scans - tool_scans) / repeat,
+            "output": output[:200],
+        }
+
+
+def run_case(cerebro, launcher, files, tools, upload_dir, rows, package_count, repeat):
+    fakes.reset(files, tools)
+    shutil.rmtree(os.path.join(upload_dir, "cerebro"), ignore_errors=True)
+    cerebro_applet = sys.modules.get("cerebro_applet")
+    if cerebro_applet:
+        cerebro_applet.invalidate()
+
+    repo_dir = tempfile.mkdtemp(prefix="cerebro-bench-repo-")
+    try:
+        package_names = build_repo(repo_dir, package_count)
+        seed_files(files, rows)
+        bench = Bench(cerebro, launcher, files, tools, repo_dir)
+        first = package_names[0]
+
+        results = [
+            bench.measure(
+                "install",
+                lambda: bench.command(f"owui install {' '.join(package_names)}"),
+            ),
+            bench.measure("list", lambda: bench.command("owui list"), repeat),
+            bench.measure("run", lambda: bench.command(f"owui run {first}"), repeat),
+            bench.measure("launch", lambda: bench.launch(f"owui run {first}"), repeat),
+            # Turns that are not commands, which every chat message is
+            bench.measure("chat_short", lambda: bench.chat([]), repeat),
+            bench.measure("chat_long", lambda: bench.chat(LONG_HISTORY), repeat),
+            bench.measure(
+                "update_unchanged", lambda: bench.command(f"owui update {first}")
+            ),
+        ]
+
+        # Change one file of the first package so the update has work to do
+        app_js = os.path.join(repo_dir, "plugins", first, "app.js")
+        with open(app_js, "a", encoding="utf-8") as f:
+            f.write("\n// changed\n")
+        results.append(
+            bench.measure(
+                "update_changed", lambda: bench.command(f"owui update {first}")
+            )
+        )
+        results.append(
+            bench.measure("uninstall", lambda: bench.command(f"owui uninstall {first}"))
+        )
+    finally:
+        shutil.rmtree(repo_dir, ignore_errors=True)
+
+    for result in results:
+        result.update(rows=rows, packages=package_count)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", default="10,1000,100000")
+    parser.add_argument("--packages", default="1,50,500")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results here instead of stdout")
+    args = parser.parse_args()
+
+    upload_dir = tempfile.mkdtemp(prefix="cerebro-bench-uploads-")
+    files, tools = fakes.install(upload_dir)
+    cerebro = load_module("cerebro", os.path.join(ROOT_DIR, "src", "cerebro.py"))
+    launcher = load_module(
+        "cerebro_tool_launcher",
+        os.path.join(ROOT_DIR, "src", "cerebro_tool_launcher.py"),
+    )
+
+    results = []
+    try:
+        for rows in [int(value) for value in args.rows.split(",")]:
+            for package_count in [int(value) for value in args.packages.split(",")]:
+                print(f"rows={rows} packages={package_count}", file=sys.stderr)
+                results += run_case(
+                    cerebro,
+                    launcher,
+                    files,
+                    tools,
+                    upload_dir,
+                    rows,
+                    package_count,
+                    args.repeat,
+                )
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    report = json.dumps(
+        {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "results": results,
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
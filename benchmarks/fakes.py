@@ -0,0 +1,141 @@
+"""
+In-memory stand-ins for the Open WebUI modules the Cerebro filters import
+(`apps.webui.models.files`, `apps.webui.models.tools` and `config`), so the package
+manager can be benchmarked without a running Open WebUI.
+
+Call install() before loading any Cerebro module.
+"""
+
+import sys
+import time
+import types
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+@dataclass
+class FileModel:
+    id: str
+    user_id: str
+    filename: str
+    meta: dict = field(default_factory=dict)
+    created_at: int = 0
+
+
+class FilesTable:
+    """
+    Dict-backed file table. `scans` counts full-table reads, the main cost the real
+    table has that a dict lookup does not.
+    """
+
+    def __init__(self):
+        self.rows: Dict[str, FileModel] = {}
+        self.scans = 0
+
+    def insert_new_file(self, user_id: str, form_data) -> Optional[FileModel]:
+        data = form_data.model_dump()
+        file = FileModel(
+            id=data["id"],
+            user_id=user_id,
+            filename=data["filename"],
+            meta=data.get("meta", {}),
+            created_at=int(time.time()),
+        )
+        self.rows[file.id] = file
+        return file
+
+    def get_file_by_id(self, id: str) -> Optional[FileModel]:
+        return self.rows.get(id)
+
+    def get_files(self) -> List[FileModel]:
+        self.scans += 1
+        return list(self.rows.values())
+
+    def delete_file_by_id(self, id: str) -> bool:
+        return self.rows.pop(id, None) is not None
+
+
+class ToolMeta(BaseModel):
+    description: Optional[str] = None
+
+
+class ToolForm(BaseModel):
+    id: str
+    name: str
+    content: str
+    meta: ToolMeta
+
+
+class ToolModel(BaseModel):
+    id: str
+    user_id: str
+    name: str
+    content: str
+    specs: list
+    meta: ToolMeta
+
+
+class ToolsTable:
+    def __init__(self):
+        self.rows: Dict[str, ToolModel] = {}
+        self.scans = 0
+
+    def insert_new_tool(
+        self, user_id: str, form_data: ToolForm, specs: list
+    ) -> Optional[ToolModel]:
+        tool = ToolModel(**form_data.model_dump(), user_id=user_id, specs=specs)
+        self.rows[tool.id] = tool
+        return tool
+
+    def get_tool_by_id(self, id: str) -> Optional[ToolModel]:
+        return self.rows.get(id)
+
+    def get_tools(self) -> List[ToolModel]:
+        self.scans += 1
+        return list(self.rows.values())
+
+    def update_tool_by_id(self, id: str, updated: dict) -> Optional[ToolModel]:
+        tool = self.rows.get(id)
+        if not tool:
+            return None
+        tool = tool.model_copy(update=updated)
+        self.rows[id] = tool
+        return tool
+
+    def delete_tool_by_id(self, id: str) -> bool:
+        return self.rows.pop(id, None) is not None
+
+
+def install(upload_dir: str):
+    """
+    Register the fake modules in sys.modules and return the (Files, Tools) tables.
+    """
+    files, tools = FilesTable(), ToolsTable()
+
+    modules = {
+        "config": {"UPLOAD_DIR": upload_dir},
+        "apps": {},
+        "apps.webui": {},
+        "apps.webui.models": {},
+        "apps.webui.models.files": {"Files": files, "FileModel": FileModel},
+        "apps.webui.models.tools": {
+            "Tools": tools,
+            "ToolForm": ToolForm,
+            "ToolMeta": ToolMeta,
+            "ToolModel": ToolModel,
+        },
+    }
+    for name, attributes in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+    return files, tools
+
+
+def reset(files: FilesTable, tools: ToolsTable):
+    files.rows.clear()
+    files.scans = 0
+    tools.rows.clear()
+    tools.scans = 0
@@ -6,13 +6,18 @@ funding_url: https://github.com/open-webui
 version: 0.1.0
 """
 
-import asyncio
-from asyncio import sleep
 from pydantic import BaseModel, Field
-from typing import Optional
-from apps.webui.models.files import Files
+from typing import Optional, Tuple
 from config import UPLOAD_DIR
 import aiohttp
+import os
+import sys
+
+CEREBRO_LIB_DIR = os.path.join(UPLOAD_DIR, "cerebro", "lib")
+if CEREBRO_LIB_DIR not in sys.path:
+    sys.path.append(CEREBRO_LIB_DIR)
+
+from cerebro_applet import AppletNotInstalled, launch_applet
 
 
 class Tools:
@@ -24,11 +29,14 @@ class Tools:
         priority: int = Field(
             default=0, description="Priority level for the filter operations."
         )
+        min_display_time: float = Field(
+            default=0,
+            description="Seconds the loading message stays up before the applet replaces it.",
+        )
 
     def __init__(self):
         self.valves = self.Valves()
         self.package_name = "forecast"
-        self.applet_file_id = None
 
     async def get_user_location(self, session):
         """
@@ -47,6 +55,53 @@ class Tools:
                 "postal": location_data["postal"],
             }
 
+    async def get_weather_report(self) -> Tuple[str, str]:
+        """
+        Return the user's detailed location and a summary of its current forecast
+        """
+        headers = {
+            "User-Agent": "(myweatherapp.com, contact@myweatherapp.com)",
+            "Accept": "application/geo+json",
+        }
+
+        async with aiohttp.ClientSession() as session:
+            # Get user's detailed location
+            location = await self.get_user_location(session)
+
+            # Get the forecast URL for the location
+            points_url = f"https://api.weather.gov/points/{location['latitude']},{location['longitude']}"
+            async with session.get(points_url, headers=headers) as response:
+                if response.status != 200:
+                    raise Exception(f"API returned status code {response.status}")
+                points_data = await response.json()
+
+            # Get the actual forecast
+            forecast_url = points_data["properties"]["forecast"]
+            async with session.get(forecast_url, headers=headers) as response:
+                if response.status != 200:
+                    raise Exception(f"API returned status code {response.status}")
+                forecast_data = await response.json()
+
+        # Extract relevant information
+        current_period = forecast_data["properties"]["periods"][0]
+        temperature = current_period["temperature"]
+        temperature_unit = current_period["temperatureUnit"]
+        description = current_period["shortForecast"]
+        wind_speed = current_period["windSpeed"]
+        wind_direction = current_period["windDirection"]
+
+        # Prepare the detailed location string
+        detailed_location = (
+            f"{location['city']}, {location['region']}, {location['country']}"
+        )
+
+        # Prepare the weather report
+        weather_report = f"Current weather in {detailed_location}:\n"
+        weather_report += f"Temperature: {temperature}°{temperature_unit}\n"
+        weather_report += f"Description: {description}\n"
+        weather_report += f"Wind: {wind_speed} from {wind_direction}"
+        return detailed_location, weather_report
+
     async def run(
         self,
         body: Optional[dict] = None,
@@ -70,103 +125,28 @@ class Tools:
         user_id = __user__["id"]
 
         try:
-            expected_filename = f"{UPLOAD_DIR}/cerebro/plugins/{self.package_name}/{self.package_name}_capp.html"
-            all_files = Files.get_files()
-            matching_file = next(
-                (
-                    file
-                    for file in all_files
-                    if file.user_id == user_id and file.filename == expected_filename
-                ),
-                None,
-            )
-
-            if not matching_file:
-                error_message = f"Error: Applet file for {self.package_name} not found. Make sure the package is installed."
-                await __event_emitter__(
-                    {"type": "replace", "data": {"content": error_message}}
-                )
-                await __event_call__(error_message)
-                return error_message
-
-            self.applet_file_id = matching_file.id
-
-            # Simulate a loading process
-            loading_messages = [
-                "Fetching weather data...",
-            ]
-            for message in loading_messages:
-                await __event_emitter__(
-                    {"type": "replace", "data": {"content": message}}
-                )
-                await asyncio.sleep(1)
-
-            headers = {
-                "User-Agent": "(myweatherapp.com, contact@myweatherapp.com)",
-                "Accept": "application/geo+json",
-            }
-
-            async with aiohttp.ClientSession() as session:
-                # Get user's detailed location
-                location = await self.get_user_location(session)
-
-                # Get the forecast URL for the location
-                points_url = f"https://api.weather.gov/points/{location['latitude']},{location['longitude']}"
-                async with session.get(points_url, headers=headers) as response:
-                    if response.status != 200:
-                        raise Exception(f"API returned status code {response.status}")
-                    points_data = await response.json()
-
-                # Get the actual forecast
-                forecast_url = points_data["properties"]["forecast"]
-                async with session.get(forecast_url, headers=headers) as response:
-                    if response.status != 200:
-                        raise Exception(f"API returned status code {response.status}")
-                    forecast_data = await response.json()
-
-            # Extract relevant information
-            current_period = forecast_data["properties"]["periods"][0]
-            temperature = current_period["temperature"]
-            temperature_unit = current_period["temperatureUnit"]
-            description = current_period["shortForecast"]
-            wind_speed = current_period["windSpeed"]
-            wind_direction = current_period["windDirection"]
-
-            # Prepare the detailed location string
-            detailed_location = (
-                f"{location['city']}, {location['region']}, {location['country']}"
-            )
-
-            # Prepare the weather report
-            weather_report = f"Current weather in {detailed_location}:\n"
-            weather_report += f"Temperature: {temperature}°{temperature_unit}\n"
-            weather_report += f"Description: {description}\n"
-            weather_report += f"Wind: {wind_speed} from {wind_direction}"
-
-            # Finally, replace with the actual applet embed and weather report
-            final_message = f"""{{{{HTML_FILE_ID_{self.applet_file_id}}}}}
-            """
-            await __event_emitter__(
-                {"type": "replace", "data": {"content": final_message}}
+            # The applet replaces the loading message as soon as the data is in
+            detailed_location, weather_report = await launch_applet(
+                user_id,
+                self.package_name,
+                __event_emitter__,
+                work=self.get_weather_report,
+                progress="Fetching weather data...",
+                min_display_time=self.valves.min_display_time,
             )
-
-            # Simulate a short delay to ensure the message is displayed
-            await sleep(0.5)
-
             return f"""You can find a summary of the weather for {detailed_location} below:\n\n
             {weather_report}
 
             Please give a detailed summary of the weather report below and ensure you infor the user of the location.
             \n\n\n
             """
-
+        except AppletNotInstalled as e:
+            error_message = str(e)
         except Exception as e:
             error_message = (
                 f"An error occurred while fetching the weather data: {str(e)}"
             )
             print(f"Debug - Error details: {e}")
-            await __event_emitter__(
-                {"type": "replace", "data": {"content": error_message}}
-            )
-            await __event_call__(error_message)
-            return error_message
+        await __event_emitter__({"type": "replace", "data": {"content": error_message}})
+        await __event_call__(error_message)
+        return error_message
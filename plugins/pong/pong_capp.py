@@ -6,12 +6,17 @@ funding_url: https://github.com/open-webui
 version: 0.1.0
 """
 
-import asyncio
-from asyncio import sleep
 from pydantic import BaseModel, Field
 from typing import Optional, Union, Generator, Iterator
-from apps.webui.models.files import Files
 from config import UPLOAD_DIR
+import os
+import sys
+
+CEREBRO_LIB_DIR = os.path.join(UPLOAD_DIR, "cerebro", "lib")
+if CEREBRO_LIB_DIR not in sys.path:
+    sys.path.append(CEREBRO_LIB_DIR)
+
+from cerebro_applet import AppletNotInstalled, launch_applet
 
 
 class Tools:
@@ -23,11 +28,14 @@ class Tools:
         priority: int = Field(
             default=0, description="Priority level for the filter operations."
         )
+        min_display_time: float = Field(
+            default=0,
+            description="Seconds the loading message stays up, if one is shown, before the applet replaces it.",
+        )
 
     def __init__(self):
         self.valves = self.Valves()
         self.package_name = "pong"
-        self.applet_file_id = None
 
     async def run(
         self,
@@ -52,52 +60,17 @@ class Tools:
         user_id = __user__["id"]
 
         try:
-            expected_filename = f"{UPLOAD_DIR}/cerebro/plugins/{self.package_name}/{self.package_name}_capp.html"
-            all_files = Files.get_files()
-            matching_file = next(
-                (
-                    file
-                    for file in all_files
-                    if file.user_id == user_id and file.filename == expected_filename
-                ),
-                None,
-            )
-
-            if not matching_file:
-                error_message = f"Error: Applet file for {self.package_name} not found. Make sure the package is installed."
-                await __event_emitter__(
-                    {"type": "replace", "data": {"content": error_message}}
-                )
-                await __event_call__(error_message)
-                return error_message
-
-            self.applet_file_id = matching_file.id
-
-            # Simulate a loading process
-            loading_messages = [
-                "Applet file found... launching",
-            ]
-            for message in loading_messages:
-                await __event_emitter__(
-                    {"type": "replace", "data": {"content": message}}
-                )
-                await asyncio.sleep(1)
-
-            # Finally, replace with the actual applet embed
-            final_message = f"{{{{HTML_FILE_ID_{self.applet_file_id}}}}}"
-            await __event_emitter__(
-                {"type": "replace", "data": {"content": final_message}}
+            await launch_applet(
+                user_id,
+                self.package_name,
+                __event_emitter__,
+                min_display_time=self.valves.min_display_time,
             )
-
-            # Simulate a short delay to ensure the message is displayed
-            await sleep(0.5)
-
             return ""
-
+        except AppletNotInstalled as e:
+            error_message = str(e)
         except Exception as e:
             error_message = f"An error occurred while launching the applet: {str(e)}"
-            await __event_emitter__(
-                {"type": "replace", "data": {"content": error_message}}
-            )
-            await __event_call__(error_message)
-            return error_message
+        await __event_emitter__({"type": "replace", "data": {"content": error_message}})
+        await __event_call__(error_message)
+        return error_message
@@ -5,38 +5,669 @@ author_url: https://github.com/atgehrhardt/Cerebro-OpenWebUI-Package-Manager
 funding_url: https://github.com/open-webui
 version: 0.2.1
 
-! ! ! 
-IMPORTANT: THIS MUST BE THE SECOND TO LAST PRIORITY IN YOUR CHAIN. SET PRIORITY HIGHER THAN ALL 
-           OTHER FUNCTIONS EXCEPT FOR THE CEREBRO TOOL LAUNCHER 
+! ! !
+IMPORTANT: THIS MUST BE THE SECOND TO LAST PRIORITY IN YOUR CHAIN. SET PRIORITY HIGHER THAN ALL
+           OTHER FUNCTIONS EXCEPT FOR THE CEREBRO TOOL LAUNCHER
 ! ! !
 
 Commands:
 `owui list` - List installed packages
-`owui install package_name` - Installs a package
+`owui install package_name [package_name ...]` - Installs one or more packages
 `owui uninstall package_name` - Uninstalls a package
-`owui update package_name` - Updates a package (uninstalls then reinstalls)
+`owui update package_name [package_name ...]` - Updates packages, rewriting only the files that changed
 `owui run package_name` - Runs an installed package in the chat window
 
 You can view all current package available for installation here: https://github.com/atgehrhardt/Cerebro-OpenWebUI-Package-Manager/tree/main/plugins
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel, Field
 import requests
+import aiohttp
+import asyncio
 import os
+import json
 import uuid
 import zipfile
-import io
 import shutil
+import sys
+import tempfile
+import re
+import time
+import hashlib
+import importlib
+import inspect
+import threading
+import contextvars
+import logging
+import mimetypes
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, urlunparse
+from urllib.request import url2pathname
 from apps.webui.models.files import Files
 from apps.webui.models.tools import Tools, ToolForm, ToolMeta
 
 from config import UPLOAD_DIR
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+log = logging.getLogger("cerebro")
+
+
+CEREBRO_LIB_DIR = os.path.join(UPLOAD_DIR, "cerebro", "lib")
+
+
+class Metrics:
+    """
+    Counters and latency histograms for package manager operations.
+
+    Everything is kept in memory and written out in the Prometheus text format to
+    UPLOAD_DIR/cerebro/metrics/<component>.prom after each command, ready for a
+    node_exporter textfile collector or anything else that can read the file.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, namespace: str, path: str):
+        self.namespace = namespace
+        self.path = path
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # Cumulative bucket counts followed by the sum and the total count
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @staticmethod
+    def format_labels(labels: tuple) -> str:
+        if not labels:
+            return ""
+        escaped = (
+            (
+                key,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for key, value in labels
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in series.items():
+                    lines.append(f"{metric}{self.format_labels(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, counts in series.items():
+                    for bound, count in zip(
+                        self.BUCKETS + ("+Inf",), counts[:-2] + counts[-1:]
+                    ):
+                        bucket_labels = self.format_labels(labels + (("le", bound),))
+                        lines.append(f"{metric}_bucket{bucket_labels} {count}")
+                    lines.append(
+                        f"{metric}_sum{self.format_labels(labels)} {counts[-2]}"
+                    )
+                    lines.append(
+                        f"{metric}_count{self.format_labels(labels)} {counts[-1]}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """
+        Atomically replace the metrics file with the current values. Failing to write
+        metrics never fails the command that produced them.
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Could not write metrics to %s: %s", self.path, e)
+
+
+metrics = Metrics(
+    "cerebro", os.path.join(UPLOAD_DIR, "cerebro", "metrics", "package_manager.prom")
+)
+
+
+@contextmanager
+def timed(span: str, **fields):
+    """
+    Log how long the wrapped block took, e.g.
+    `span=extract package=snake duration_ms=12.3`, and record it in the
+    stage_duration_seconds histogram.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("stage_duration_seconds", elapsed, stage=span)
+        if log.isEnabledFor(logging.INFO):
+            log.info(
+                "span=%s %sduration_ms=%.1f",
+                span,
+                "".join(f"{key}={value} " for key, value in fields.items()),
+                elapsed * 1000,
+            )
+
+
+class FileForm(BaseModel):
+    id: str
+    filename: str
+    meta: dict = {}
+
+
+# Asset URLs carry the content hash, so a URL's content never changes
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def asset_response(file_path: str, sha256: str, if_none_match: Optional[str] = None):
+    """
+    Serve an installed file with a strong ETag (its SHA-256) and a year long
+    Cache-Control, or an empty 304 if the client already has this content.
+    """
+    from starlette.responses import FileResponse, Response
+
+    etag = f'"{sha256}"'
+    headers = {"ETag": etag, "Cache-Control": ASSET_CACHE_CONTROL}
+    if if_none_match and any(
+        tag.strip() in (etag, f"W/{etag}", "*") for tag in if_none_match.split(",")
+    ):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file_path, headers=headers)
+
+
+class AppletTemplate:
+    """
+    An applet file with `{filename}` placeholders, e.g. `<script src="{app.js}">`.
+
+    The source is split into text and placeholder names once, and rendering joins the
+    parts in a single pass, so the cost stays linear in the size of the file however
+    many files it references. `${...}` (JavaScript template literals) is left alone.
+    """
+
+    PLACEHOLDER_PATTERN = re.compile(r"(?<!\$)\{([\w./-]+\.\w+)\}")
+
+    def __init__(self, source: str):
+        # Text at even indexes, placeholder names at odd ones
+        self.parts = self.PLACEHOLDER_PATTERN.split(source)
+
+    @property
+    def references(self) -> List[str]:
+        return self.parts[1::2]
+
+    def render(self, values: Dict[str, str]) -> Tuple[str, List[str]]:
+        """
+        Return the rendered text and the placeholders that have no value, which are
+        left as they are.
+        """
+        parts = list(self.parts)
+        unresolved = []
+        for i in range(1, len(parts), 2):
+            value = values.get(parts[i])
+            if value is None:
+                unresolved.append(parts[i])
+                parts[i] = "{" + parts[i] + "}"
+            else:
+                parts[i] = value
+        return "".join(parts), unresolved
+
+
+class PackageIndex:
+    """
+    Manifest of installed packages, which also indexes their files by
+    (user_id, package_name, filename).
+
+    Each user gets one small JSON file under UPLOAD_DIR/cerebro/index so lookups
+    never have to scan the whole files table or walk the plugins directory. Every
+    package entry holds:
+
+    - `name`, `version` (from the applet's `<meta name="version">` tag), `tool_id`,
+      `description`, `tool_sha256` and `installed_at`
+    - `files`: file ID by path relative to the package directory, e.g. `snake_capp.html`
+    - `sources`: CRC, size and SHA-256 of each file in the repository archive, and
+      the `blob` its content is stored in (see BlobStore)
+
+    Next to the packages, `tools` caches the parsed metadata of tool sources by their
+    SHA-256, and keeps it for a while after a package is removed so reinstalling the
+    same source needs no parsing.
+
+    The file is replaced atomically on every change, and kept in memory for as long
+    as its mtime does not change. Changes go through `update`, which locks the file
+    against other workers for the whole read-modify-write.
+    """
+
+    MAX_CACHED_TOOLS = 64
+
+    def __init__(self, root: str):
+        self.root = root
+        self._cache = {}
+        # Batch installs update the manifest from several worker threads
+        self._lock = threading.RLock()
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.root, f"{user_id}.json")
+
+    def _mtime(self, user_id: str) -> Optional[int]:
+        try:
+            return os.stat(self._path(user_id)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def exists(self, user_id: str) -> bool:
+        return os.path.exists(self._path(user_id))
+
+    def load(self, user_id: str) -> dict:
+        with self._lock:
+            mtime = self._mtime(user_id)
+            cached = self._cache.get(user_id)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+            try:
+                with open(self._path(user_id), "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                manifest = {"packages": {}}
+            self._cache[user_id] = (mtime, manifest)
+            return manifest
+
+    @contextmanager
+    def update(self, user_id: str):
+        """
+        Lock a user's manifest against other threads and processes and yield it, as
+        last written by any of them. It is saved when the block completes.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(user_id)
+        lock_path = os.path.join(self.root, f"{user_id}.lock")
+        with self._lock, open(lock_path, "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self.load(user_id)
+            try:
+                yield manifest
+            except BaseException:
+                # Forget the half-made changes, the file still has the last state
+                self._cache.pop(user_id, None)
+                raise
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            # json.dumps encodes in C, json.dump goes through the pure Python encoder
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(manifest))
+            os.replace(tmp_path, path)
+            self._cache[user_id] = (self._mtime(user_id), manifest)
+
+    def get(self, user_id: str, package_name: str, filename: str) -> Optional[str]:
+        with self._lock:
+            package = self.load(user_id)["packages"].get(package_name)
+            if not package:
+                return None
+            return package["files"].get(filename)
+
+    def get_package(self, user_id: str, package_name: str) -> Dict[str, str]:
+        with self._lock:
+            package = self.load(user_id)["packages"].get(package_name)
+            return dict(package["files"]) if package else {}
+
+    def get_record(self, user_id: str, package_name: str) -> Optional[dict]:
+        with self._lock:
+            package = self.load(user_id)["packages"].get(package_name)
+            return dict(package) if package else None
+
+    def packages(self, user_id: str) -> List[str]:
+        with self._lock:
+            return sorted(self.load(user_id)["packages"])
+
+    def records(self, user_id: str) -> List[dict]:
+        with self._lock:
+            packages = self.load(user_id)["packages"]
+            return [{"name": name, **packages[name]} for name in sorted(packages)]
+
+    def add(
+        self,
+        user_id: str,
+        package_name: str,
+        filename: str,
+        file_id: str,
+        source: Optional[dict] = None,
+    ):
+        with self.update(user_id) as manifest:
+            package = manifest["packages"].setdefault(
+                package_name, {"name": package_name, "files": {}}
+            )
+            package["files"][filename] = file_id
+            if source:
+                package.setdefault("sources", {})[filename] = source
+
+    def get_tool_id(self, user_id: str, package_name: str) -> Optional[str]:
+        with self._lock:
+            package = self.load(user_id)["packages"].get(package_name)
+            return package.get("tool_id") if package else None
+
+    def get_tool_meta(self, user_id: str, sha256: str) -> Optional[dict]:
+        with self._lock:
+            meta = self.load(user_id).get("tools", {}).get(sha256)
+            return {"sha256": sha256, **meta} if meta else None
+
+    def set_package(
+        self,
+        user_id: str,
+        package_name: str,
+        files: Dict[str, str],
+        sources: Optional[Dict[str, dict]] = None,
+        tool_meta: Optional[dict] = None,
+        **details,
+    ):
+        """
+        Replace a package's entry. `sources` holds the CRC, size and SHA-256 of each
+        file as it appears in the repository archive, used by incremental updates;
+        `tool_meta` is the parsed metadata of the package's tool, cached by its
+        `sha256`; `details` holds the version, tool ID, tool description and install
+        time.
+        """
+        with self.update(user_id) as manifest:
+            record = {
+                "name": package_name,
+                **details,
+                "files": dict(files),
+                "sources": dict(sources or {}),
+            }
+            if tool_meta:
+                sha256 = tool_meta["sha256"]
+                record["tool_sha256"] = sha256
+                tools = manifest.setdefault("tools", {})
+                tools.pop(sha256, None)
+                tools[sha256] = {
+                    key: value for key, value in tool_meta.items() if key != "sha256"
+                }
+            manifest["packages"][package_name] = record
+            self.prune_tools(manifest)
+
+    def prune_tools(self, manifest: dict):
+        # Drop the oldest cached tools no installed package refers to
+        tools = manifest.get("tools", {})
+        if len(tools) <= self.MAX_CACHED_TOOLS:
+            return
+        in_use = {
+            package.get("tool_sha256") for package in manifest["packages"].values()
+        }
+        for sha256 in [sha256 for sha256 in tools if sha256 not in in_use]:
+            if len(tools) <= self.MAX_CACHED_TOOLS:
+                break
+            del tools[sha256]
+
+    def remove(self, user_id: str, package_name: str, filename: str):
+        with self.update(user_id) as manifest:
+            package = manifest["packages"].get(package_name)
+            if package and package["files"].pop(filename, None) is not None:
+                if not package["files"]:
+                    del manifest["packages"][package_name]
+
+    def remove_package(self, user_id: str, package_name: str) -> Optional[dict]:
+        with self.update(user_id) as manifest:
+            return manifest["packages"].pop(package_name, None)
+
+
+class BlobStore:
+    """
+    Content-addressed store for package files under UPLOAD_DIR/cerebro/blobs.
+
+    Every unique content is written once, to `<sha256[:2]>/<sha256><ext>`, however
+    many users and packages install it; the extension is kept because Open WebUI
+    picks the content type it serves a file with from its path. Users still get
+    their own file rows, pointing at the blob. `refs.json` counts the rows that
+    use each blob, and a blob is deleted along with the last of them.
+
+    Every worker process shares the store, so the counts are only read and changed
+    under an exclusive lock on `refs.lock`.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    @contextmanager
+    def refs(self):
+        """
+        Lock the store against other threads and processes and yield the reference
+        counts, which are saved when the block completes.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, "refs.json")
+        with self._lock, open(os.path.join(self.root, "refs.lock"), "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    refs = json.load(f)
+            except FileNotFoundError:
+                refs = {}
+            yield refs
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(refs))
+            os.replace(tmp_path, path)
+
+    def add(self, chunks, ext: str = "") -> Tuple[str, int, str]:
+        """
+        Store chunks of bytes and take a reference to them. Returns the blob name,
+        size and SHA-256; content that is already stored is not written again.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f"tmp.{os.getpid()}.{threading.get_ident()}")
+        size = 0
+        sha256 = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    sha256.update(chunk)
+        except IOError as e:
+            raise IOError(f"Error writing blob: {str(e)}")
+
+        sha256 = sha256.hexdigest()
+        name = f"{sha256}{ext.lower()}"
+        with self.refs() as refs:
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                metrics.inc("blobs_stored_total", result="deduplicated")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                metrics.inc("blobs_stored_total", result="new")
+                metrics.inc("blob_bytes_written_total", size)
+            refs[name] = refs.get(name, 0) + 1
+        return name, size, sha256
+
+    def release(self, names: List[str]) -> int:
+        """
+        Drop one reference per name and delete the blobs nothing refers to anymore.
+        Returns how many were deleted.
+        """
+        if not names:
+            return 0
+        deleted = 0
+        with self.refs() as refs:
+            for name in names:
+                count = refs.get(name, 0) - 1
+                if count > 0:
+                    refs[name] = count
+                    continue
+                refs.pop(name, None)
+                try:
+                    os.remove(self.path(name))
+                    deleted += 1
+                    os.rmdir(os.path.dirname(self.path(name)))
+                except OSError:
+                    # Already gone, or other blobs share its directory
+                    pass
+        metrics.inc("blobs_deleted_total", deleted)
+        return deleted
+
+
+class RequestContext:
+    """
+    State of one package command, handed from inlet to outlet.
+    """
+
+    def __init__(self, user_id: Optional[str] = None):
+        self.user_id = user_id
+        self.pkg_launch = False
+        self.file = None
+        self.last_created_file = None
+        self.installed_pkgs = []
+        self.packages = []
+        self.batch_results = {}
+        self.created_at = time.monotonic()
+
+
+class RequestContextStore:
+    """
+    Bounded map of pending request contexts keyed by (user_id, command). Contexts
+    whose outlet never arrives expire after `ttl` seconds, and the oldest are dropped
+    once more than `max_size` are pending.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key: tuple, context: RequestContext):
+        with self._lock:
+            self._contexts.pop(key, None)
+            self._contexts[key] = context
+            expires_before = time.monotonic() - self.ttl
+            while self._contexts and (
+                len(self._contexts) > self.max_size
+                or next(iter(self._contexts.values())).created_at < expires_before
+            ):
+                self._contexts.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._contexts)
+
+    def pop(self, key: tuple) -> Optional[RequestContext]:
+        """
+        Return and remove the context stored under key. With no command in the key,
+        the user's most recent context is taken instead.
+        """
+        with self._lock:
+            if key[1] is None:
+                key = next((k for k in reversed(self._contexts) if k[0] == key[0]), key)
+            context = self._contexts.pop(key, None)
+        if context and context.created_at < time.monotonic() - self.ttl:
+            return None
+        return context
+
+
+# Context of the request being handled by the current task or thread
+current_request = contextvars.ContextVar("cerebro_request", default=None)
+
+
+def request_state(name: str) -> property:
+    """
+    Filter attribute stored on the current request's context rather than on the
+    shared Filter instance.
+    """
+
+    def getter(self):
+        return getattr(current_request.get() or self.default_context, name)
+
+    def setter(self, value):
+        setattr(current_request.get() or self.default_context, name, value)
+
+    return property(getter, setter)
+
 
 class Filter:
+    RUNTIME_MODULE = "cerebro_applet"
+    ASSET_ROUTE = "/cerebro/assets/{file_id}"
+    # Bumped whenever parse_tool_meta changes, to re-parse cached tool metadata
+    TOOL_META_PARSER = 3
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
     SUPPORTED_COMMANDS = ["run", "install", "uninstall", "list", "update"]
+    STATUS_MESSAGES = {
+        "Installed": "Package Installed",
+        "Already Installed": "Package Already Installed",
+        "Install Failed": "Package Install Failed",
+        "Uninstalled": "Package Uninstalled",
+        "Updated": "Package Updated Successfully",
+        "Up To Date": "Package Already Up To Date",
+        "Update Failed": "Package Update Failed",
+        "Not Installed": "Package Not Installed. Cannot Update.",
+        "none": "Package Not installed",
+    }
+    VERSION_PATTERN = re.compile(
+        r"<meta\s+name=[\"']version[\"']\s+content=[\"']([^\"']*)[\"']", re.IGNORECASE
+    )
+    # The layout every applet tool uses: a top level `class Tools:` with a docstring,
+    # a nested `class Valves(BaseModel):` and a `run` method
+    TOOLS_DOCSTRING_PATTERN = re.compile(
+        r"^class Tools\b[^\n]*:[ \t]*\n(?P<indent>[ \t]+)(?P<quote>\"\"\"|\'\'\')(?P<doc>.*?)(?P=quote)",
+        re.MULTILINE | re.DOTALL,
+    )
+    # The first statement after a class body, i.e. the next non-blank, non-comment
+    # line that is not indented
+    TOP_LEVEL_STATEMENT_PATTERN = re.compile(r"^[^\s#]", re.MULTILINE)
+    VALVES_BLOCK_PATTERN = re.compile(
+        r"^(?P<indent>[ \t]+)class Valves\b[^\n]*:[ \t]*\n(?P<body>(?:(?P=indent)[ \t]+[^\n]*\n|[ \t]*\n)*)",
+        re.MULTILINE,
+    )
+    STYLESHEET_TAG_PATTERN = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+    SCRIPT_TAG_PATTERN = re.compile(
+        r"<script\b(?P<attributes>[^>]*)>\s*</script\s*>", re.IGNORECASE
+    )
+    TAG_ATTRIBUTE_PATTERN = re.compile(
+        r"([\w-]+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'>]+)))?"
+    )
+    BUNDLE_MARKER_PATTERN = re.compile("\x00cerebro:(\\d+)\x00")
+    VALVE_FIELD_PATTERN = re.compile(r"^[ \t]+(\w+)[ \t]*:", re.MULTILINE)
+    RUNTIME_IMPORT_PATTERN = re.compile(
+        r"^[ \t]*(?:from|import)[ \t]+cerebro_applet\b", re.MULTILINE
+    )
+    RUN_SIGNATURE_PATTERN = re.compile(
+        r"^(?P<indent>[ \t]+)(?:async[ \t]+)?def run\((?P<params>[^)]*)\)", re.MULTILINE
+    )
 
     class Valves(BaseModel):
         priority: int = Field(
@@ -53,44 +684,218 @@ class Filter:
             "CEREBRO_PACKAGE_REPO_URL",
             "https://github.com/atgehrhardt/Cerebro-OpenWebUI-Package-Manager/tree/main/plugins",
         )
+        max_workers: int = Field(
+            default=4,
+            description="Worker threads used to install or update several packages at once.",
+        )
+        log_level: str = Field(
+            default="INFO",
+            description="Log level: DEBUG, INFO, WARNING or ERROR. DEBUG also logs request bodies.",
+        )
+        archive_cache_ttl: int = Field(
+            default=300,
+            description="Seconds a cached repository archive is used before it is revalidated.",
+        )
+        bundle_assets: bool = Field(
+            default=True,
+            description="Inline each applet's local stylesheets and scripts into its HTML file at install time.",
+        )
+        minify_assets: bool = Field(
+            default=False,
+            description="Strip comments and blank lines from inlined stylesheets and scripts. Scripts with template literals or multi-line strings are left as they are.",
+        )
+        serve_assets: bool = Field(
+            default=False,
+            description="Point applet asset URLs at Cerebro's own route, which lets browsers cache them for a year. The route is added to Open WebUI the first time a URL uses it, and stays until Open WebUI restarts, even if this is turned off or the function disabled.",
+        )
+
+    # Per-request state, so concurrent requests never see each other's results
+    user_id = request_state("user_id")
+    pkg_launch = request_state("pkg_launch")
+    file = request_state("file")
+    last_created_file = request_state("last_created_file")
+    installed_pkgs = request_state("installed_pkgs")
+    packages = request_state("packages")
+    batch_results = request_state("batch_results")
 
     def __init__(self):
         self.valves = self.Valves()
-        self.last_created_file = None
         self.selected_model = None
-        self.user_id = None
-        self.file = None
-        self.package_files = {}
-        self.pkg_launch = False
-        self.installed_pkgs = []
-        self.packages = []
+        self.default_context = RequestContext()
+        self.contexts = RequestContextStore()
+        self.index = PackageIndex(os.path.join(UPLOAD_DIR, "cerebro", "index"))
+        self.blobs = BlobStore(os.path.join(UPLOAD_DIR, "cerebro", "blobs"))
+        self.asset_route_lock = threading.Lock()
+        self.asset_route_mounted = False
+
+    def mount_asset_route(self):
+        """
+        Add GET /api/v1/cerebro/assets/{file_id} to Open WebUI, which serves the
+        user's installed package files with long-lived caching headers (see
+        asset_response). Only called once the serve_assets valve is on, as valves
+        are not loaded yet in __init__.
+        """
+        with self.asset_route_lock:
+            if self.asset_route_mounted:
+                return
+            self.asset_route_mounted = True
+        try:
+            from fastapi import Depends, HTTPException, Request
+            from apps.webui.main import app as webui_app
+            from utils.utils import get_verified_user
+        except ImportError as e:
+            log.debug("Not serving assets: %s", e)
+            return
+        if any(
+            getattr(route, "path", None) == self.ASSET_ROUTE
+            for route in webui_app.routes
+        ):
+            return
+
+        async def get_asset(
+            file_id: str, request: Request, user=Depends(get_verified_user)
+        ):
+            file = Files.get_file_by_id(file_id)
+            meta = (file.meta or {}) if file else {}
+            if (
+                not file
+                or (file.user_id != user.id and user.role != "admin")
+                or not meta.get("sha256")
+                or not meta.get("path", "").startswith(
+                    os.path.join(UPLOAD_DIR, "cerebro", "")
+                )
+                or not os.path.isfile(meta["path"])
+            ):
+                raise HTTPException(status_code=404, detail="Asset not found")
+            return asset_response(
+                meta["path"], meta["sha256"], request.headers.get("if-none-match")
+            )
+
+        webui_app.add_api_route(self.ASSET_ROUTE, get_asset, methods=["GET"])
+        log.info("Serving package assets at /api/v1%s", self.ASSET_ROUTE)
+
+    def ensure_index(self, user_id: str):
+        """
+        Build the package index for a user who installed packages before the
+        index existed. This is the only place that scans the whole files and tools
+        tables, and it runs at most once per user.
+        """
+        if self.index.exists(user_id):
+            return
+
+        log.info("Building package index for user %s", user_id)
+        marker = "/cerebro/plugins/"
+        with self.index.update(user_id) as manifest:
+            packages = manifest["packages"]
+            for file in Files.get_files():
+                if file.user_id != user_id or marker not in file.filename:
+                    continue
+                relative_path = file.filename.split(marker, 1)[1]
+                package_name, _, filename = relative_path.partition("/")
+                if filename:
+                    packages.setdefault(
+                        package_name, {"name": package_name, "files": {}}
+                    )["files"][filename] = file.id
+
+            # Record the IDs of the packages' tools, so they are never looked up
+            # by name
+            for tool in Tools.get_tools():
+                package = packages.get(tool.name[len("cer_") :])
+                if (
+                    package
+                    and tool.name.startswith("cer_")
+                    and getattr(tool, "user_id", user_id) == user_id
+                ):
+                    package["tool_id"] = tool.id
+
+    def install_runtime(
+        self,
+        zip_ref: zipfile.ZipFile,
+        package_dir: str,
+        tool_content: Optional[str] = None,
+    ):
+        """
+        Copy the shared applet runtime (src/cerebro_applet.py) from the repository
+        archive to UPLOAD_DIR/cerebro/lib, where the applet tools import it from.
+        Repositories without it can still be installed from, unless the package's
+        tool imports the runtime.
+        """
+        runtime_member = f"{package_dir.split('/')[0]}/src/{self.RUNTIME_MODULE}.py"
+        try:
+            zip_ref.getinfo(runtime_member)
+        except KeyError:
+            if tool_content and self.RUNTIME_IMPORT_PATTERN.search(tool_content):
+                raise FileNotFoundError(
+                    f"Applet runtime {runtime_member} not found in zip file"
+                )
+            log.warning("Applet runtime %s not found in zip file", runtime_member)
+            return
+
+        os.makedirs(CEREBRO_LIB_DIR, exist_ok=True)
+        runtime_file = os.path.join(CEREBRO_LIB_DIR, f"{self.RUNTIME_MODULE}.py")
+        tmp_file = f"{runtime_file}.{threading.get_ident()}.tmp"
+        with zip_ref.open(runtime_member) as src, open(tmp_file, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_file, runtime_file)
+        log.info("Installed applet runtime to %s", runtime_file)
+
+    def notify_runtime(
+        self,
+        package_name: str,
+        file_ids: Optional[Dict[str, str]] = None,
+        description: Optional[str] = None,
+    ):
+        """
+        Tell the applet runtime that a package was installed or updated (file_ids
+        given) or removed, so the launcher's registry of applets stays current.
+        """
+        # Only reach into the runtime if a tool has already imported it in this process
+        if self.RUNTIME_MODULE not in sys.modules:
+            return
+        applet_file_id = (file_ids or {}).get(f"{package_name}_capp.html")
+        # The registry also re-reads the index once it changes, so a failed
+        # notification only costs that re-read and must never undo the install
+        try:
+            runtime = importlib.import_module(self.RUNTIME_MODULE)
+            if not hasattr(runtime, "package_installed"):
+                # Loaded before the runtime had events
+                runtime.invalidate(self.user_id, package_name)
+            elif applet_file_id:
+                runtime.package_installed(
+                    self.user_id, package_name, applet_file_id, description
+                )
+            elif file_ids is None:
+                runtime.package_removed(self.user_id, package_name)
+        except Exception as e:
+            log.warning(
+                "Failed to notify the applet runtime about %s: %s", package_name, e
+            )
 
     def check_tool_exists(self, tool_name: str) -> bool:
-        tool_file = os.path.join(
-            UPLOAD_DIR, "cerebro", "plugins", tool_name, f"{tool_name}_capp.py"
-        )
-        return os.path.exists(tool_file)
+        return self.is_package_installed(tool_name)
 
     def uninstall_tool(self, tool_name: str):
         if not self.check_tool_exists(tool_name):
-            print(f"Tool {tool_name} does not exist.")
+            log.warning("Tool %s does not exist", tool_name)
             return
 
         try:
-            # Get the tool by name
-            tools = Tools.get_tools()
-            tool = next((t for t in tools if t.name == tool_name), None)
+            # Get the tool ID recorded at install time
+            self.ensure_index(self.user_id)
+            tool_id = self.index.get_tool_id(self.user_id, tool_name)
 
-            if tool:
+            if tool_id:
                 # Delete the tool from the database
-                if Tools.delete_tool_by_id(tool.id):
-                    print(
-                        f"Tool {tool_name} uninstalled successfully from the database."
+                if Tools.delete_tool_by_id(tool_id):
+                    log.info(
+                        "Tool %s uninstalled successfully from the database", tool_name
                     )
                 else:
-                    print(f"Failed to uninstall tool {tool_name} from the database.")
+                    log.error(
+                        "Failed to uninstall tool %s from the database", tool_name
+                    )
             else:
-                print(f"Tool {tool_name} not found in the database.")
+                log.warning("Tool %s not found in the database", tool_name)
 
             # Remove the tool file
             tool_file = os.path.join(
@@ -98,7 +903,7 @@ class Filter:
             )
             if os.path.exists(tool_file):
                 os.remove(tool_file)
-                print(f"Removed tool file: {tool_file}")
+                log.info("Removed tool file: %s", tool_file)
 
             self.pkg_launch = "Tool Uninstalled"
         except Exception as e:
@@ -106,11 +911,11 @@ class Filter:
 
     def update_tool(self, tool_name: str):
         if not self.check_tool_exists(tool_name):
-            print(f"Tool {tool_name} does not exist. Cannot update.")
+            log.warning("Tool %s does not exist. Cannot update", tool_name)
             self.pkg_launch = "Tool Not Installed"
             return
 
-        print(f"Updating tool {tool_name}...")
+        log.info("Updating tool %s", tool_name)
         try:
             # Uninstall the tool
             self.uninstall_tool(tool_name)
@@ -118,111 +923,356 @@ class Filter:
             # Install the tool again
             self.install_package(tool_name)  # This will install both package and tool
 
-            print(f"Tool {tool_name} updated successfully.")
+            log.info("Tool %s updated successfully", tool_name)
             self.pkg_launch = "Tool Updated"
         except Exception as e:
-            print(f"Error updating tool {tool_name}: {str(e)}")
+            log.error("Error updating tool %s: %s", tool_name, e)
             self.pkg_launch = "Tool Update Failed"
             raise Exception(f"Error updating tool {tool_name}: {str(e)}")
 
-    def create_file(
+    def write_file(self, file_path: str, chunks) -> Tuple[str, int, str]:
+        """
+        Store the content of the package file at file_path in the blob store and
+        return the blob name, size and SHA-256 of what was written, so the file never
+        has to be read back.
+        """
+        log.debug("Storing %s", file_path)
+        return self.blobs.add(chunks, os.path.splitext(file_path)[1])
+
+    def build_file_record(
         self,
-        package_name,
+        file_id: str,
         file_name: str,
         title: str,
-        content: str,
+        file_path: str,
+        size: int,
+        sha256: str,
+    ) -> dict:
+        return {
+            "id": file_id,
+            "filename": file_name,
+            "meta": {
+                "source": file_name,
+                "title": title,
+                "content_type": mimetypes.guess_type(file_name)[0]
+                or "application/octet-stream",
+                "size": size,
+                "sha256": sha256,
+                "path": file_path,
+            },
+        }
+
+    def get_files_backend(self):
+        """
+        Return the file table model and a transaction helper for the running Open WebUI
+        version: ("peewee", DB, File) up to 0.3.9, ("sqlalchemy", get_db, File) from
+        0.3.10, or ("api", None, None) when neither can be imported.
+        """
+        try:
+            from apps.webui.models.files import File
+
+            if hasattr(File, "insert_many"):
+                from apps.webui.internal.db import DB
+
+                return "peewee", DB, File
+
+            from apps.webui.internal.db import get_db
+
+            return "sqlalchemy", get_db, File
+        except ImportError:
+            return "api", None, None
+
+    def write_files(
+        self,
+        inserted: List[dict] = (),
+        updated: List[dict] = (),
+        deleted: List[str] = (),
         user_id: Optional[str] = None,
-    ):
+    ) -> int:
+        """
+        Insert, update and delete file rows in a single transaction, so a failure
+        leaves the table as it was. Updated rows keep their IDs and get the record's
+        filename and meta. Returns how many rows were deleted.
+        """
         user_id = user_id or self.user_id
 
-        if not user_id:
+        if inserted and not user_id:
             raise ValueError("User ID is required to create a file.")
+        if not (inserted or updated or deleted):
+            return 0
 
-        base_path = os.path.join(UPLOAD_DIR, "cerebro", "plugins", package_name)
-        os.makedirs(base_path, exist_ok=True)
+        created_at = int(time.time())
+        rows = [
+            {**record, "user_id": user_id, "created_at": created_at}
+            for record in inserted
+        ]
 
-        file_id = str(uuid.uuid4())
-        file_path = os.path.join(base_path, file_name)
+        backend, db, File = self.get_files_backend()
+        try:
+            if backend == "peewee":
+                with db.atomic():
+                    if rows:
+                        File.insert_many(rows).execute()
+                    for record in updated:
+                        File.update(
+                            filename=record["filename"], meta=record["meta"]
+                        ).where(File.id == record["id"]).execute()
+                    deleted_count = (
+                        File.delete().where(File.id.in_(deleted)).execute()
+                        if deleted
+                        else 0
+                    )
+            elif backend == "sqlalchemy":
+                with db() as session:
+                    session.add_all([File(**row) for row in rows])
+                    for record in updated:
+                        session.query(File).filter_by(id=record["id"]).update(
+                            {"filename": record["filename"], "meta": record["meta"]}
+                        )
+                    deleted_count = (
+                        session.query(File)
+                        .filter(File.id.in_(deleted))
+                        .delete(synchronize_session=False)
+                        if deleted
+                        else 0
+                    )
+                    session.commit()
+            else:
+                deleted_count = self.write_files_api(
+                    user_id, inserted, updated, deleted
+                )
+        except Exception as e:
+            raise Exception(f"Error writing files to database: {str(e)}")
+
+        for operation, count in (
+            ("insert", len(rows)),
+            ("update", len(updated)),
+            ("delete", deleted_count),
+        ):
+            if count:
+                metrics.inc("db_rows_written_total", count, operation=operation)
+        log.info(
+            "Wrote files to the database: %s inserted, %s updated, %s deleted",
+            len(rows),
+            len(updated),
+            deleted_count,
+        )
+        return deleted_count
 
+    def write_files_api(
+        self,
+        user_id: str,
+        inserted: List[dict],
+        updated: List[dict],
+        deleted: List[str],
+    ) -> int:
+        """
+        write_files through the Files API, which has no transactions: inserts and
+        updates are undone by hand if any of them fails, and rows are deleted last.
+        """
+        inserted_ids = []
+        # Rows as they were before being updated, for putting them back
+        previous = []
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                print(f"Writing file to {file_path}...")
-                f.write(content)
-        except IOError as e:
-            raise IOError(f"Error writing file to {file_path}: {str(e)}")
+            for record in inserted:
+                if not Files.insert_new_file(user_id, FileForm(**record)):
+                    raise Exception(f"Insert of {record['filename']} failed")
+                inserted_ids.append(record["id"])
+            # The Files API has no update, so re-insert each row under the same ID
+            for record in updated:
+                file = Files.get_file_by_id(record["id"])
+                Files.delete_file_by_id(record["id"])
+                if file:
+                    previous.append(file)
+                if not Files.insert_new_file(
+                    file.user_id if file else user_id, FileForm(**record)
+                ):
+                    raise Exception(f"Update of {record['filename']} failed")
+        except Exception:
+            for file_id in inserted_ids:
+                Files.delete_file_by_id(file_id)
+            for file in previous:
+                Files.delete_file_by_id(file.id)
+                Files.insert_new_file(
+                    file.user_id,
+                    FileForm(id=file.id, filename=file.filename, meta=file.meta),
+                )
+            raise
+        return sum(1 for file_id in deleted if Files.delete_file_by_id(file_id))
 
+    def register_files(self, records: List[dict], user_id: Optional[str] = None):
+        """
+        Insert the file rows of a package in a single transaction. Either every row is
+        inserted or none are.
+        """
+        self.write_files(inserted=records, user_id=user_id)
+
+    def deregister_files(self, file_ids: List[str]) -> int:
+        """
+        Delete the given file rows in a single transaction and return how many were
+        deleted.
+        """
+        return self.write_files(deleted=file_ids)
+
+    def register_file(
+        self,
+        file_id: str,
+        file_name: str,
+        title: str,
+        file_path: str,
+        size: int,
+        sha256: str,
+        user_id: Optional[str] = None,
+    ):
+        record = self.build_file_record(
+            file_id, file_name, title, file_path, size, sha256
+        )
         try:
-            meta = {
-                "source": file_path,
-                "title": title,
-                "content_type": "text/html",
-                "size": os.path.getsize(file_path),
-                "path": file_path,
-            }
-        except FileNotFoundError as e:
-            raise FileNotFoundError(f"File {file_path} not found: {str(e)}")
+            self.register_files([record], user_id)
+        except Exception:
+            self.blobs.release([os.path.basename(file_path)])
+            raise
 
-        class FileForm(BaseModel):
-            id: str
-            filename: str
-            meta: dict = {}
+        self.file = Files.get_file_by_id(file_id)
+        self.last_created_file = self.file
+        return self.file
 
-        form_data = FileForm(id=file_id, filename=file_name, meta=meta)
+    def create_file(
+        self,
+        package_name,
+        file_name: str,
+        title: str,
+        content: str,
+        user_id: Optional[str] = None,
+    ):
+        user_id = user_id or self.user_id
+
+        if not user_id:
+            raise ValueError("User ID is required to create a file.")
+
+        base_path = os.path.join(UPLOAD_DIR, "cerebro", "plugins", package_name)
+        file_path = os.path.join(base_path, file_name)
+        blob, size, sha256 = self.write_file(file_path, [content.encode("utf-8")])
+
+        return self.register_file(
+            str(uuid.uuid4()),
+            file_name,
+            title,
+            self.blobs.path(blob),
+            size,
+            sha256,
+            user_id,
+        )
 
+    def get_file_url(self, file_id: str, sha256: Optional[str] = None) -> str:
+        """
+        Return the URL of a file's content. Given the content's SHA-256 the URL is
+        versioned with it, so browsers fetch it again only when the content changes.
+        """
+        if sha256 and self.valves.serve_assets:
+            self.mount_asset_route()
+            return (
+                f"{self.valves.open_webui_host}/api/v1"
+                f"{self.ASSET_ROUTE.format(file_id=file_id)}?v={sha256[:16]}"
+            )
+        url = f"{self.valves.open_webui_host}/api/v1/files/{file_id}/content"
+        return f"{url}?v={sha256[:16]}" if sha256 else url
+
+    def find_package_file(self, package_name: str, file_name: str) -> Optional[str]:
+        self.ensure_index(self.user_id)
+        file_id = self.index.get(self.user_id, package_name, file_name)
+        if file_id and not Files.get_file_by_id(file_id):
+            log.debug("Indexed file %s no longer exists, removing from index", file_id)
+            self.index.remove(self.user_id, package_name, file_name)
+            file_id = None
+        return file_id
+
+    def add_package_file(self, package_name: str, file_name: str, file_content: str):
         try:
-            self.file = Files.insert_new_file(user_id, form_data)
-            self.last_created_file = self.file
-            return self.file
+            if not self.user_id:
+                raise ValueError("User ID is not set. Cannot create file.")
+            created_file = self.create_file(
+                package_name, file_name, file_name, file_content, self.user_id
+            )
+            file_id = created_file.id if hasattr(created_file, "id") else created_file
+            meta = getattr(created_file, "meta", None) or {}
+            self.index.add(
+                self.user_id,
+                package_name,
+                file_name,
+                file_id,
+                {"blob": os.path.basename(meta["path"])} if "path" in meta else None,
+            )
+            self.notify_runtime(package_name, {file_name: file_id})
+            return file_id
         except Exception as e:
-            os.remove(file_path)
-            raise Exception(f"Error inserting file into database: {str(e)}")
-
-    def get_file_url(self, file_id: str) -> str:
-        return f"{self.valves.open_webui_host}/api/v1/files/{file_id}/content"
+            log.error("Error creating file: %s", e)
+            raise Exception(f"Error creating file: {str(e)}")
 
     def handle_package(self, package_name, url: str, file_name: str):
-        files = Files.get_files()
-        files = [file for file in files if file.user_id == self.user_id]
-        files = [file for file in files if file_name in file.filename]
-        print("Files: ", files)
-
-        if files:
-            self.file = files[0].id
-            print(f"\n{self.file}\n")
-            print("File already exists")
+        file_id = self.find_package_file(package_name, file_name)
+
+        if file_id:
+            self.file = file_id
+            log.debug("Using existing file %s for %s", file_id, file_name)
         else:
             if not url:
-                print("No URL provided, cannot download the file.")
+                log.warning("No URL provided, cannot download the file")
                 return
 
             try:
-                print(f"Downloading the file from {url}...\n")
+                log.info("Downloading %s from %s", file_name, url)
                 response = requests.get(url)
                 response.raise_for_status()
                 file_content = response.text
-                print("Downloaded file content:")
-                print(file_content)
             except Exception as e:
                 raise Exception(f"Error downloading {file_name}: {str(e)}")
 
+            self.file = self.add_package_file(package_name, file_name, file_content)
+
+        return self.file
+
+    async def handle_package_async(self, package_name, url: str, file_name: str):
+        file_id = await asyncio.to_thread(
+            self.find_package_file, package_name, file_name
+        )
+
+        if file_id:
+            self.file = file_id
+            log.debug("Using existing file %s for %s", file_id, file_name)
+        else:
+            if not url:
+                log.warning("No URL provided, cannot download the file")
+                return
+
             try:
-                if not self.user_id:
-                    raise ValueError("User ID is not set. Cannot create file.")
-                created_file = self.create_file(
-                    package_name, file_name, file_name, file_content, self.user_id
-                )
-                self.file = (
-                    created_file.id if hasattr(created_file, "id") else created_file
-                )
+                log.info("Downloading %s from %s", file_name, url)
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(url) as response:
+                        response.raise_for_status()
+                        file_content = await response.text()
             except Exception as e:
-                print(f"Error creating file: {str(e)}")
-                raise Exception(f"Error creating file: {str(e)}")
+                raise Exception(f"Error downloading {file_name}: {str(e)}")
+
+            self.file = await asyncio.to_thread(
+                self.add_package_file, package_name, file_name, file_content
+            )
 
         return self.file
 
     def is_package_installed(self, package_name: str) -> bool:
-        package_dir = os.path.join(UPLOAD_DIR, "cerebro", "plugins", package_name)
-        return os.path.exists(package_dir)
+        self.ensure_index(self.user_id)
+        return package_name in self.index.packages(self.user_id)
+
+    def get_local_repo_path(self, tree_url: str) -> Optional[str]:
+        """
+        Return the local plugins directory for file:// or plain directory repo URLs.
+        """
+        if tree_url.startswith("file://"):
+            return url2pathname(urlparse(tree_url).path)
+        if os.path.isdir(tree_url):
+            return tree_url
+        return None
 
     def get_zip_url_from_tree_url(self, tree_url: str) -> str:
         parsed_url = urlparse(tree_url)
@@ -241,6 +1291,10 @@ class Filter:
             return f"{tree_url}/archive/main.zip"
 
     def get_subdirectory_from_tree_url(self, tree_url: str) -> str:
+        local_path = self.get_local_repo_path(tree_url)
+        if local_path:
+            return os.path.basename(os.path.normpath(local_path))
+
         parsed_url = urlparse(tree_url)
         path_parts = parsed_url.path.split("/")
 
@@ -250,331 +1304,1177 @@ class Filter:
         else:
             return ""
 
-    def install_package(self, package_name: str):
-        tree_url = self.valves.package_repo_url
-        zip_url = self.get_zip_url_from_tree_url(tree_url)
-        subdirectory = self.get_subdirectory_from_tree_url(tree_url)
+    def build_local_archive(self, plugins_dir: str, archive_path: str):
+        """
+        Pack a local plugins directory (and the repo's src directory next to it) into a
+        zip laid out like a GitHub archive, so local repos install the same way.
+        """
+        plugins_dir = os.path.normpath(plugins_dir)
+        repo_dir = os.path.dirname(plugins_dir)
+        prefix = f"{os.path.basename(repo_dir)}-local"
+        sources = [plugins_dir, os.path.join(repo_dir, "src")]
+
+        newest = 0
+        for source in sources:
+            for root, dirs, files in os.walk(source):
+                newest = max(
+                    [newest, os.path.getmtime(root)]
+                    + [os.path.getmtime(os.path.join(root, file)) for file in files]
+                )
+        if os.path.exists(archive_path) and os.path.getmtime(archive_path) >= newest:
+            log.debug("Using cached archive of local repo %s", plugins_dir)
+            metrics.inc("archive_cache_total", result="hit")
+            return
+
+        metrics.inc("archive_cache_total", result="miss")
+        log.info("Building archive of local repo %s", plugins_dir)
+        tmp_path = self.get_temp_path(archive_path)
+        try:
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+                for source in sources:
+                    for root, dirs, files in os.walk(source):
+                        dirs[:] = sorted(
+                            d for d in dirs if not d.startswith((".", "__"))
+                        )
+                        relative_root = os.path.relpath(root, repo_dir).replace(
+                            os.sep, "/"
+                        )
+                        zip_ref.writestr(f"{prefix}/{relative_root}/", "")
+                        for file in sorted(files):
+                            zip_ref.write(
+                                os.path.join(root, file),
+                                f"{prefix}/{relative_root}/{file}",
+                            )
+            os.replace(tmp_path, archive_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_temp_path(self, path: str) -> str:
+        """
+        Create an empty temporary file next to path, unique to this caller, to write
+        a new version of path to before it is moved into place.
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path),
+            prefix=f"{os.path.basename(path)}.",
+            suffix=".tmp",
+        )
+        os.close(fd)
+        return tmp_path
 
-        print(f"Tree URL: {tree_url}")
-        print(f"Zip URL: {zip_url}")
-        print(f"Subdirectory: {subdirectory}")
+    def prepare_archive_fetch(self, tree_url: str):
+        """
+        Work out whether the cached repository archive can be used as is.
 
-        if self.is_package_installed(package_name):
-            print(f"Package {package_name} is already installed.")
-            self.pkg_launch = "Already Installed"
-            return
+        Archives are cached under UPLOAD_DIR/cerebro/cache together with their ETag and
+        Last-Modified headers. A cached archive is used as is for `archive_cache_ttl`
+        seconds and then revalidated with a conditional request. Returns the archive
+        and meta paths, the cached meta, and the zip URL and headers to request; the
+        URL is None when no request is needed.
+        """
+        cache_dir = os.path.join(UPLOAD_DIR, "cerebro", "cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_key = hashlib.sha1(tree_url.encode("utf-8")).hexdigest()
+        archive_path = os.path.join(cache_dir, f"{cache_key}.zip")
+        meta_path = os.path.join(cache_dir, f"{cache_key}.json")
+
+        local_path = self.get_local_repo_path(tree_url)
+        if local_path:
+            self.build_local_archive(local_path, archive_path)
+            return archive_path, meta_path, None, None, {}
+
+        meta = None
+        if os.path.exists(archive_path) and os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if time.time() - meta["fetched_at"] < self.valves.archive_cache_ttl:
+                log.debug("Using cached archive %s", archive_path)
+                metrics.inc("archive_cache_total", result="hit")
+                return archive_path, meta_path, meta, None, {}
+
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        zip_url = self.get_zip_url_from_tree_url(tree_url)
+        return archive_path, meta_path, meta, zip_url, headers
 
+    def save_archive_meta(self, meta_path: str, meta: dict):
+        meta["fetched_at"] = time.time()
+        tmp_path = self.get_temp_path(meta_path)
         try:
-            # Download the zip file
-            print(f"Downloading zip file from: {zip_url}")
-            response = requests.get(zip_url)
-            response.raise_for_status()
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(meta))
+            os.replace(tmp_path, meta_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def fetch_archive(self, tree_url: str) -> str:
+        """
+        Return the path of a local copy of the repository archive, downloading it
+        only when the cached copy is missing or out of date.
+        """
+        archive_path, meta_path, meta, zip_url, headers = self.prepare_archive_fetch(
+            tree_url
+        )
+        if not zip_url:
+            return archive_path
+
+        log.info("Downloading zip file from: %s", zip_url)
+        with requests.get(zip_url, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                log.debug("Cached archive %s is still current", archive_path)
+                metrics.inc("archive_cache_total", result="revalidated")
+            else:
+                response.raise_for_status()
+                # Stream to disk in chunks so memory use does not grow with the repo
+                tmp_path = self.get_temp_path(archive_path)
+                downloaded = 0
+                try:
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_content(
+                            chunk_size=self.DOWNLOAD_CHUNK_SIZE
+                        ):
+                            f.write(chunk)
+                            downloaded += len(chunk)
+                    os.replace(tmp_path, archive_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                metrics.inc("archive_cache_total", result="miss")
+                metrics.inc("download_bytes_total", downloaded)
+                meta = {
+                    "url": zip_url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+
+        self.save_archive_meta(meta_path, meta)
+        return archive_path
+
+    async def fetch_archive_async(self, tree_url: str) -> str:
+        """
+        Non-blocking version of fetch_archive: the download goes through aiohttp and
+        all file system work runs in the default executor.
+        """
+        archive_path, meta_path, meta, zip_url, headers = await asyncio.to_thread(
+            self.prepare_archive_fetch, tree_url
+        )
+        if not zip_url:
+            return archive_path
+
+        log.info("Downloading zip file from: %s", zip_url)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(zip_url, headers=headers) as response:
+                if response.status == 304:
+                    log.debug("Cached archive %s is still current", archive_path)
+                    metrics.inc("archive_cache_total", result="revalidated")
+                else:
+                    response.raise_for_status()
+                    tmp_path = await asyncio.to_thread(self.get_temp_path, archive_path)
+                    downloaded = 0
+                    try:
+                        f = await asyncio.to_thread(open, tmp_path, "wb")
+                        try:
+                            async for chunk in response.content.iter_chunked(
+                                self.DOWNLOAD_CHUNK_SIZE
+                            ):
+                                await asyncio.to_thread(f.write, chunk)
+                                downloaded += len(chunk)
+                        finally:
+                            await asyncio.to_thread(f.close)
+                        await asyncio.to_thread(os.replace, tmp_path, archive_path)
+                    finally:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                    metrics.inc("archive_cache_total", result="miss")
+                    metrics.inc("download_bytes_total", downloaded)
+                    meta = {
+                        "url": zip_url,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                    }
+
+        await asyncio.to_thread(self.save_archive_meta, meta_path, meta)
+        return archive_path
+
+    def find_package_dir(
+        self, zip_ref: zipfile.ZipFile, subdirectory: str, package_name: str
+    ) -> Optional[str]:
+        """
+        Return the `<repo>-<branch>/<subdirectory>/<package_name>/` prefix of a package
+        in the archive, or None if the archive does not contain it.
+        """
+        package_path = (
+            f"{subdirectory}/{package_name}/" if subdirectory else f"{package_name}/"
+        )
+        for member in zip_ref.infolist():
+            top_dir, _, path = member.filename.partition("/")
+            if path.startswith(package_path):
+                return f"{top_dir}/{package_path}"
+        return None
+
+    def open_package(
+        self, zip_ref: zipfile.ZipFile, package_name: str
+    ) -> Tuple[str, List[zipfile.ZipInfo]]:
+        """
+        Return the package's directory prefix in the archive and its file members.
+        """
+        subdirectory = self.get_subdirectory_from_tree_url(self.valves.package_repo_url)
+        package_dir = self.find_package_dir(zip_ref, subdirectory, package_name)
 
-            # Get the repo name and branch from the url
-            repo_name = tree_url.split("/")[-4]
-            branch = tree_url.split("/")[-2]
+        if not package_dir:
+            raise FileNotFoundError(
+                f"Package directory for {package_name} not found in zip file"
+            )
 
-            # Extract the specific package directory
-            with zipfile.ZipFile(io.BytesIO(response.content)) as zip_ref:
-                all_files = zip_ref.namelist()
-                print(f"Files in zip: {all_files}")
-
-                # Try to find the package directory
-                package_dir = None
-                for file in all_files:
-                    if file.endswith(
-                        f"{subdirectory}/{package_name}/"
-                    ) or file.endswith(f"{subdirectory}/{package_name}"):
-                        package_dir = file
-                        break
-
-                if not package_dir:
-                    raise FileNotFoundError(
-                        f"Package directory for {package_name} not found in zip file"
+        log.debug("Found package directory: %s", package_dir)
+
+        members = [
+            member
+            for member in zip_ref.infolist()
+            if member.filename.startswith(package_dir) and not member.is_dir()
+        ]
+        for member in members:
+            if not self.is_safe_path(member.filename[len(package_dir) :]):
+                raise ValueError(f"Unsafe path in package archive: {member.filename}")
+        return package_dir, members
+
+    def is_safe_path(self, relative_path: str) -> bool:
+        """
+        Whether a path from an archive stays inside the directory it is relative to:
+        not absolute and without `..` components.
+        """
+        parts = re.split(r"[\\/]", relative_path)
+        return bool(relative_path) and not (
+            parts[0] == ""
+            or parts[0].endswith(":")
+            or ".." in parts
+            or os.path.isabs(relative_path)
+        )
+
+    def extract_package_files(
+        self,
+        zip_ref: zipfile.ZipFile,
+        package_name: str,
+        package_dir: str,
+        members: List[zipfile.ZipInfo],
+        file_ids: Dict[str, str],
+        hashes: Optional[Dict[str, str]] = None,
+    ) -> Tuple[List[dict], Dict[str, dict], Optional[str], Optional[str]]:
+        """
+        Write the given members straight to the blob store in a single pass.
+
+        `file_ids` maps every file of the package, by its path relative to the package
+        directory, to its file ID; it is used to render the applet (see
+        render_applet), along with `hashes`, the SHA-256 of the package's files that
+        are not among the members. Returns the file records to register, the source
+        hashes and blobs of the written files, and the tool source and applet version
+        if the tool and applet were among the members. If anything fails, the blobs
+        written so far are released again.
+        """
+        dst_dir = os.path.join(UPLOAD_DIR, "cerebro", "plugins", package_name)
+        capp_name = f"{package_name}_capp.html"
+        tool_name = f"{package_name}_capp.py"
+        tool_content = None
+        version = None
+        records = []
+        sources = {}
+        hashes = dict(hashes or {})
+
+        # Write the applet last, once the hashes its asset URLs carry are all known
+        members = sorted(
+            members, key=lambda member: member.filename == package_dir + capp_name
+        )
+        try:
+            for member in members:
+                relative_path = member.filename[len(package_dir) :]
+                # Rows keep the file's path in the package as their name, which is
+                # what the index and the launcher go by
+                file_path = os.path.join(dst_dir, relative_path)
+                log.debug("Extracting %s", member.filename)
+
+                source_sha256 = None
+                with zip_ref.open(member) as src:
+                    if relative_path == capp_name:
+                        capp_source = src.read()
+                        source_sha256 = hashlib.sha256(capp_source).hexdigest()
+                        capp_content = capp_source.decode("utf-8")
+                        version_match = self.VERSION_PATTERN.search(capp_content)
+                        if version_match:
+                            version = version_match.group(1)
+                        capp_content = self.render_applet(
+                            zip_ref, package_dir, capp_content, file_ids, hashes
+                        )
+                        chunks = [capp_content.encode("utf-8")]
+                    elif relative_path == tool_name:
+                        tool_content = src.read().decode("utf-8")
+                        chunks = [tool_content.encode("utf-8")]
+                    else:
+                        chunks = iter(lambda: src.read(self.DOWNLOAD_CHUNK_SIZE), b"")
+                    blob, size, sha256 = self.write_file(file_path, chunks)
+                hashes[relative_path] = sha256
+
+                records.append(
+                    self.build_file_record(
+                        file_ids[relative_path],
+                        file_path,
+                        file_path,
+                        self.blobs.path(blob),
+                        size,
+                        sha256,
                     )
+                )
+                sources[relative_path] = {
+                    "crc": member.CRC,
+                    "size": member.file_size,
+                    "sha256": source_sha256 or sha256,
+                    "blob": blob,
+                }
+        except Exception:
+            self.blobs.release([source["blob"] for source in sources.values()])
+            raise
+
+        metrics.inc("files_extracted_total", len(records))
+        return records, sources, tool_content, version
+
+    def get_placeholder_urls(
+        self, file_ids: Dict[str, str], hashes: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
+        """
+        Map every name a placeholder may use for a file of this package, its relative
+        path or its basename, to the file content URL, versioned with the file's
+        SHA-256 where it is in `hashes`.
+        """
+        hashes = hashes or {}
+        urls = {}
+        for relative_path, file_id in file_ids.items():
+            url = self.get_file_url(file_id, hashes.get(relative_path))
+            urls.setdefault(os.path.basename(relative_path), url)
+            urls[relative_path] = url
+        return urls
+
+    def render_placeholders(
+        self, content: str, urls: Dict[str, str], source: str = ""
+    ) -> str:
+        content, unresolved = AppletTemplate(content).render(urls)
+        if unresolved:
+            log.warning(
+                "Unresolved placeholders in %s: %s",
+                source or "applet",
+                ", ".join(sorted(set(unresolved))),
+            )
+        return content
 
-                print(f"Found package directory: {package_dir}")
+    def render_applet(
+        self,
+        zip_ref: zipfile.ZipFile,
+        package_dir: str,
+        capp_content: str,
+        file_ids: Dict[str, str],
+        hashes: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """
+        Render the applet's `{filename}` placeholders as file URLs and, with the
+        `bundle_assets` valve on, inline the package's own stylesheets and scripts so
+        the applet loads with a single request.
+        """
+        capp_name = os.path.basename(package_dir.rstrip("/")) + "_capp.html"
+        urls = self.get_placeholder_urls(file_ids, hashes)
+        if not self.valves.bundle_assets:
+            return self.render_placeholders(capp_content, urls, capp_name)
 
-                # Extract the package files
-                for file in all_files:
-                    if file.startswith(package_dir):
-                        print(f"Extracting {file}...")
-                        zip_ref.extract(file, UPLOAD_DIR)
+        blocks = []
 
-            # Get the source directory
-            src_dir = os.path.join(UPLOAD_DIR, package_dir)
-            dst_dir = os.path.join(UPLOAD_DIR, "cerebro", "plugins", package_name)
+        def read_asset(reference: str) -> Optional[str]:
+            relative_path = self.resolve_asset(reference, file_ids)
+            if not relative_path:
+                return None
+            try:
+                asset = zip_ref.read(package_dir + relative_path).decode("utf-8")
+            except (KeyError, UnicodeDecodeError):
+                return None
+            # Assets may use placeholders too, e.g. url({background.png})
+            return self.render_placeholders(asset, urls, relative_path)
+
+        def inline_stylesheet(match: re.Match) -> str:
+            attributes = self.parse_tag_attributes(match.group(0))
+            if "stylesheet" not in attributes.get("rel", "").lower().split():
+                return match.group(0)
+            css = read_asset(attributes.get("href", ""))
+            if css is None:
+                return match.group(0)
+            if self.valves.minify_assets:
+                css = self.minify_css(css)
+            css = re.sub(r"</(style)", r"<\\/\1", css, flags=re.IGNORECASE)
+            blocks.append(f"<style>\n{css}\n</style>")
+            return f"\x00cerebro:{len(blocks) - 1}\x00"
+
+        def inline_script(match: re.Match) -> str:
+            attributes = self.parse_tag_attributes(match.group("attributes"))
+            # Inline scripts ignore defer and async, so leave those alone
+            if (
+                "src" not in attributes
+                or "defer" in attributes
+                or "async" in attributes
+            ):
+                return match.group(0)
+            js = read_asset(attributes["src"])
+            if js is None:
+                return match.group(0)
+            if self.valves.minify_assets:
+                js = self.minify_js(js)
+            js = re.sub(r"</(script)", r"<\\/\1", js, flags=re.IGNORECASE)
+            script_type = attributes.get("type")
+            open_tag = f'<script type="{script_type}">' if script_type else "<script>"
+            blocks.append(f"{open_tag}\n{js}\n</script>")
+            return f"\x00cerebro:{len(blocks) - 1}\x00"
+
+        capp_content = self.STYLESHEET_TAG_PATTERN.sub(inline_stylesheet, capp_content)
+        capp_content = self.SCRIPT_TAG_PATTERN.sub(inline_script, capp_content)
+        capp_content = self.render_placeholders(capp_content, urls, capp_name)
+        # Put the inlined code in only after rendering, so braces in it are never
+        # mistaken for placeholders
+        return self.BUNDLE_MARKER_PATTERN.sub(
+            lambda match: blocks[int(match.group(1))], capp_content
+        )
 
-            print(f"Source directory: {src_dir}")
-            print(f"Destination directory: {dst_dir}")
+    def parse_tag_attributes(self, tag: str) -> Dict[str, str]:
+        attributes = {}
+        for name, double, single, bare in self.TAG_ATTRIBUTE_PATTERN.findall(tag):
+            attributes[name.lower()] = double or single or bare
+        return attributes
 
-            # Check if the source directory exists
-            if not os.path.exists(src_dir):
-                raise FileNotFoundError(f"Source directory not found: {src_dir}")
+    def resolve_asset(self, reference: str, file_ids: Dict[str, str]) -> Optional[str]:
+        """
+        Return the package relative path a `href`/`src` refers to, for a `{filename}`
+        placeholder or a relative path inside the package, or None for anything else.
+        """
+        reference = reference.strip()
+        if reference.startswith("{") and reference.endswith("}"):
+            reference = reference[1:-1]
+        elif ":" in reference or reference.startswith("/") or "{" in reference:
+            return None
+        if reference.startswith("./"):
+            reference = reference[2:]
+        if reference in file_ids:
+            return reference
+        # Placeholders have always been matched on the file's basename
+        return next(
+            (path for path in file_ids if os.path.basename(path) == reference), None
+        )
 
-            # Create the destination directory if it doesn't exist
-            os.makedirs(os.path.dirname(dst_dir), exist_ok=True)
+    def minify_css(self, css: str) -> str:
+        css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+        css = re.sub(r"\s+", " ", css)
+        return re.sub(r"\s*([{};,>])\s*", r"\1", css).strip()
+
+    def minify_js(self, js: str) -> str:
+        # Deliberately conservative: without a real parser only whole-line comments,
+        # trailing whitespace and blank lines are safe to drop, and only when no
+        # string spans lines (template literals or backslash continuations)
+        if "`" in js or re.search(r"\\\r?$", js, re.MULTILINE):
+            return js
+        lines = (line.rstrip() for line in js.splitlines())
+        return "\n".join(
+            line for line in lines if line and not line.lstrip().startswith("//")
+        )
 
-            # Move the package directory to the plugins directory
-            shutil.move(src_dir, dst_dir)
+    def get_tool_meta(self, tool_content: str) -> dict:
+        """
+        Return the parsed metadata of a tool source (see parse_tool_meta) along with its
+        `sha256`. Sources that were parsed before are served from the manifest.
+        """
+        sha256 = hashlib.sha256(tool_content.encode("utf-8")).hexdigest()
+        meta = self.index.get_tool_meta(self.user_id, sha256)
+        # Entries cached by an older parser may be wrong, parse those again
+        if meta is None or meta.get("parser") != self.TOOL_META_PARSER:
+            meta = {
+                "sha256": sha256,
+                "parser": self.TOOL_META_PARSER,
+                **self.parse_tool_meta(tool_content),
+            }
+        return meta
 
-            # Remove the extracted directory
-            extracted_dir = os.path.join(UPLOAD_DIR, f"{repo_name}-{branch}")
-            shutil.rmtree(extracted_dir)
+    def build_tool_meta(
+        self,
+        package_name: str,
+        tool_content: str,
+        parsed_meta: Optional[dict] = None,
+    ) -> ToolMeta:
+        # Extract the description from the tool content
+        description = "Tool for " + package_name  # Default description
+        parsed_meta = parsed_meta or self.get_tool_meta(tool_content)
+        if parsed_meta.get("description"):
+            description = parsed_meta["description"].strip()
+        return ToolMeta(description=description)
+
+    def install_tool(
+        self,
+        package_name: str,
+        tool_content: str,
+        tool_meta: Optional[ToolMeta] = None,
+    ):
+        log.info("Installing tool for package: %s", package_name)
+
+        # Prepend "cer_" to the tool name
+        cer_tool_name = f"cer_{package_name}"
+        tool_meta = tool_meta or self.build_tool_meta(package_name, tool_content)
+
+        # Create a ToolForm instance with the modified name and description
+        tool_form = ToolForm(
+            id=str(uuid.uuid4()),
+            name=cer_tool_name,
+            content=tool_content,
+            meta=tool_meta,
+        )
 
-            # Loop through all the files in the package directory and create them in the database
-            for root, dirs, files in os.walk(dst_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    print(f"Creating file: {file_path}")
+        # Insert the tool
+        tool = Tools.insert_new_tool(self.user_id, tool_form, [])
+        if tool:
+            log.info(
+                "Tool for package %s installed successfully as %s with description: %s",
+                package_name,
+                cer_tool_name,
+                tool_meta.description,
+            )
+        else:
+            log.error("Failed to install tool for package %s", package_name)
+        return tool
 
-                    # Get the content of each file
-                    try:
-                        with open(file_path, "r", encoding="utf-8") as f:
-                            file_content = f.read()
+    def update_tool_content(
+        self,
+        package_name: str,
+        tool_content: str,
+        tool_meta: Optional[ToolMeta] = None,
+        tool_id: Optional[str] = None,
+    ):
+        cer_tool_name = f"cer_{package_name}"
+        tool_meta = tool_meta or self.build_tool_meta(package_name, tool_content)
+        tool = None
+        if tool_id:
+            tool = Tools.update_tool_by_id(
+                tool_id, {"content": tool_content, "meta": tool_meta.model_dump()}
+            )
+        if not tool:
+            # No tool recorded, or it was deleted outside of Cerebro
+            return self.install_tool(package_name, tool_content, tool_meta)
 
-                        filename = os.path.basename(file_path)
-                        # Create file in the database
-                        created_file = self.create_file(
-                            package_name,
-                            f"{file_path}",
-                            f"{file_path}",
-                            file_content,
-                            self.user_id,
-                        )
+        # Drop the loaded module so the next call runs the new source
+        try:
+            from apps.webui.main import app as webui_app
 
-                        self.package_files[filename] = (
-                            created_file.id
-                            if hasattr(created_file, "id")
-                            else created_file
-                        )
-                    except Exception as e:
-                        print(f"Error creating file: {str(e)}")
-                        raise Exception(f"Error creating file: {str(e)}")
-
-            # Update the contents of _capp.html file
-            capp_file = os.path.join(dst_dir, f"{package_name}_capp.html")
-            if os.path.exists(capp_file):
-                with open(capp_file, "r", encoding="utf-8") as f:
-                    capp_content = f.read()
-                    for filename, file_id in self.package_files.items():
-                        # Replace the filename with the file content url
-                        capp_content = capp_content.replace(
-                            "{" + filename + "}", self.get_file_url(file_id)
+            webui_app.state.TOOLS.pop(tool.id, None)
+        except (ImportError, AttributeError):
+            pass
+
+        log.info("Tool %s updated", cer_tool_name)
+        return tool
+
+    def install_package(self, package_name: str, archive_path: Optional[str] = None):
+        tree_url = self.valves.package_repo_url
+
+        log.debug("Tree URL: %s", tree_url)
+
+        if self.is_package_installed(package_name):
+            log.warning("Package %s is already installed", package_name)
+            self.pkg_launch = "Already Installed"
+            return self.pkg_launch
+
+        registered_ids = []
+        blobs = []
+        tool_id = None
+
+        try:
+            # Download the zip file, or reuse the cached copy
+            if not archive_path:
+                with timed("download", url=tree_url):
+                    archive_path = self.fetch_archive(tree_url)
+
+            # Extract the specific package directory
+            # Only the zip's central directory and the package's own members are read
+            with zipfile.ZipFile(archive_path) as zip_ref:
+                package_dir, members = self.open_package(zip_ref, package_name)
+
+                # Assign file IDs up front so the applet can be rendered as it is
+                # extracted and every file is written exactly once
+                file_ids = {
+                    member.filename[len(package_dir) :]: str(uuid.uuid4())
+                    for member in members
+                }
+                with timed("extract", package=package_name, files=len(members)):
+                    records, sources, tool_content, version = (
+                        self.extract_package_files(
+                            zip_ref, package_name, package_dir, members, file_ids
                         )
-                # Update the content of the _capp.html file
-                with open(capp_file, "w", encoding="utf-8") as f:
-                    f.write(capp_content)
-            else:
-                print(f"Warning: {capp_file} not found. Skipping content update.")
+                    )
+                blobs = [source["blob"] for source in sources.values()]
+
+                self.install_runtime(zip_ref, package_dir, tool_content)
+
+            # Create every file of the package in the database in one transaction
+            with timed("register", package=package_name, files=len(records)):
+                self.register_files(records, self.user_id)
+            registered_ids = list(file_ids.values())
+
+            capp_name = f"{package_name}_capp.html"
+            if capp_name not in file_ids:
+                log.warning("%s not found. Skipping content update", capp_name)
 
             # Check for and install tool
-            tool_file = os.path.join(dst_dir, f"{package_name}_capp.py")
-            if os.path.exists(tool_file):
-                print(f"Installing tool for package: {package_name}")
-                with open(tool_file, "r", encoding="utf-8") as f:
-                    tool_content = f.read()
-
-                # Prepend "cer_" to the tool name
-                cer_tool_name = f"cer_{package_name}"
-
-                # Extract the description from the tool content
-                description = "Tool for " + package_name  # Default description
-                doc_string = self.extract_class_docstring(tool_content)
-                if doc_string:
-                    description = doc_string.strip()
-
-                # Create a ToolForm instance with the modified name and description
-                tool_form = ToolForm(
-                    id=str(uuid.uuid4()),
-                    name=cer_tool_name,
-                    content=tool_content,
-                    meta=ToolMeta(description=description),
+            description = None
+            parsed_meta = None
+            if tool_content is not None:
+                parsed_meta = self.get_tool_meta(tool_content)
+                tool_meta = self.build_tool_meta(
+                    package_name, tool_content, parsed_meta
                 )
+                description = tool_meta.description
+                with timed("tool", package=package_name):
+                    tool = self.install_tool(package_name, tool_content, tool_meta)
+                tool_id = tool.id if tool else None
+
+            # Record the package in the manifest with a single write
+            self.index.set_package(
+                self.user_id,
+                package_name,
+                file_ids,
+                sources,
+                parsed_meta,
+                version=version,
+                tool_id=tool_id,
+                description=description,
+                installed_at=int(time.time()),
+            )
 
-                # Insert the tool
-                tool = Tools.insert_new_tool(self.user_id, tool_form, [])
-                if tool:
-                    print(
-                        f"Tool for package {package_name} installed successfully as {cer_tool_name} with description: {description}"
-                    )
-                else:
-                    print(f"Failed to install tool for package {package_name}.")
-
-            print(f"Package {package_name} installed successfully.")
+            self.notify_runtime(package_name, file_ids, description)
+            log.info("Package %s installed successfully", package_name)
             self.pkg_launch = "Installed"
+            return self.pkg_launch
 
         except Exception as e:
-            print(f"Error installing package {package_name}: {str(e)}")
+            log.error("Error installing package %s: %s", package_name, e)
+            self.rollback_install(package_name, registered_ids, blobs, tool_id)
             raise Exception(f"Error installing package {package_name}: {str(e)}")
 
-    def extract_class_docstring(self, content: str) -> Optional[str]:
+    def rollback_install(
+        self,
+        package_name: str,
+        file_ids: List[str],
+        blobs: List[str],
+        tool_id: Optional[str] = None,
+    ):
+        """
+        Undo a partially completed install so a retry starts from a clean state.
+        """
+        try:
+            if tool_id:
+                Tools.delete_tool_by_id(tool_id)
+            self.deregister_files(file_ids)
+            self.blobs.release(blobs)
+            if package_name in self.index.packages(self.user_id):
+                self.index.remove_package(self.user_id, package_name)
+            log.info("Rolled back install of package %s", package_name)
+        except Exception as e:
+            log.error("Error rolling back install of package %s: %s", package_name, e)
+
+    def parse_tool_meta(self, content: str) -> dict:
         """
-        Extract the docstring of the first class in the given content.
+        Return the class docstring (`description`), the valve names (`valves`) and the
+        `run` parameters (`run_params`) of a tool. Tools in the usual applet layout are
+        read with a few regular expressions; anything else is parsed with ast.
         """
+        docstring = self.TOOLS_DOCSTRING_PATTERN.search(content)
+        # Escapes in the docstring need Python's own string parsing
+        if not docstring or "\\" in docstring.group("doc"):
+            return self.parse_tool_meta_ast(content)
+
+        # Only look at the statements directly in the Tools body; like ast, the last
+        # definition of a name wins
+        start = docstring.end()
+        end = self.TOP_LEVEL_STATEMENT_PATTERN.search(content, start)
+        end = end.start() if end else len(content)
+        indent = docstring.group("indent")
+        run = valves = None
+        for match in self.RUN_SIGNATURE_PATTERN.finditer(content, start, end):
+            if match.group("indent") == indent:
+                run = match
+        for match in self.VALVES_BLOCK_PATTERN.finditer(content, start, end):
+            if match.group("indent") == indent:
+                valves = match
+        # The pattern stops at the first `)`, and strings may hold anything, so
+        # leave defaults with calls or strings in them to ast
+        if not run or re.search(r"[(\"']", run.group("params")):
+            return self.parse_tool_meta_ast(content)
+
+        params = []
+        depth = 0
+        param = ""
+        for char in run.group("params") + ",":
+            if char in "[{":
+                depth += 1
+            elif char in "]}":
+                depth -= 1
+            elif char == "," and depth == 0:
+                name = re.split(r"[:=]", param, 1)[0].strip().lstrip("*")
+                if name:
+                    params.append(name)
+                param = ""
+                continue
+            param += char
+
+        return {
+            "description": inspect.cleandoc(docstring.group("doc")),
+            "valves": (
+                self.VALVE_FIELD_PATTERN.findall(valves.group("body")) if valves else []
+            ),
+            "run_params": params,
+        }
+
+    def parse_tool_meta_ast(self, content: str) -> dict:
         import ast
 
+        meta = {"description": None, "valves": [], "run_params": []}
         try:
             tree = ast.parse(content)
-            for node in ast.walk(tree):
-                if isinstance(node, ast.ClassDef):
-                    docstring = ast.get_docstring(node)
-                    if docstring:
-                        return docstring
         except SyntaxError:
-            print("Failed to parse the tool content")
-        return None
-
-    def update_package(self, package_name: str):
+            log.error("Failed to parse the tool content")
+            return meta
+
+        classes = [node for node in tree.body if isinstance(node, ast.ClassDef)]
+        tools = next((node for node in classes if node.name == "Tools"), None)
+        for node in ([tools] if tools else []) + classes:
+            meta["description"] = ast.get_docstring(node)
+            if meta["description"]:
+                break
+        if not tools:
+            return meta
+
+        for node in tools.body:
+            if isinstance(node, ast.ClassDef) and node.name == "Valves":
+                meta["valves"] = [
+                    field.target.id
+                    for field in node.body
+                    if isinstance(field, ast.AnnAssign)
+                    and isinstance(field.target, ast.Name)
+                ]
+            elif (
+                isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+                and node.name == "run"
+            ):
+                args = node.args
+                meta["run_params"] = [
+                    arg.arg
+                    for arg in args.posonlyargs
+                    + args.args
+                    + ([args.vararg] if args.vararg else [])
+                    + args.kwonlyargs
+                    + ([args.kwarg] if args.kwarg else [])
+                ]
+        return meta
+
+    def update_package(self, package_name: str, archive_path: Optional[str] = None):
+        """
+        Bring an installed package in line with the repository. Only files whose
+        content changed are rewritten, files keep their IDs so existing
+        HTML_FILE_ID_ embeds keep working, and nothing is touched when the package
+        is already up to date.
+        """
         if not self.is_package_installed(package_name):
-            print(f"Package {package_name} is not installed. Cannot update.")
+            log.info("Package %s is not installed. Cannot update", package_name)
             self.pkg_launch = "Not Installed"
-            return
+            return self.pkg_launch
+
+        log.info("Updating package %s", package_name)
+        self.ensure_index(self.user_id)
+        dst_dir = os.path.join(UPLOAD_DIR, "cerebro", "plugins", package_name)
+        blobs = []
 
-        print(f"Updating package {package_name}...")
         try:
-            # Uninstall the package (which will also uninstall the tool)
-            self.uninstall_package(package_name)
+            if not archive_path:
+                with timed("download", url=self.valves.package_repo_url):
+                    archive_path = self.fetch_archive(self.valves.package_repo_url)
+
+            with zipfile.ZipFile(archive_path) as zip_ref:
+                package_dir, members = self.open_package(zip_ref, package_name)
+
+                package = self.index.get_record(self.user_id, package_name) or {
+                    "files": {}
+                }
+                installed_files = package["files"]
+                installed_sources = package.get("sources", {})
+
+                # Compare against the zip's CRC and size, so unchanged files are
+                # never decompressed
+                file_ids = {}
+                added = []
+                changed = []
+                for member in members:
+                    relative_path = member.filename[len(package_dir) :]
+                    source = installed_sources.get(relative_path)
+                    if relative_path not in installed_files:
+                        file_ids[relative_path] = str(uuid.uuid4())
+                        added.append(member)
+                    else:
+                        file_ids[relative_path] = installed_files[relative_path]
+                        if (
+                            not source
+                            or source.get("crc") != member.CRC
+                            or source.get("size") != member.file_size
+                        ):
+                            changed.append(member)
+
+                removed = {
+                    relative_path: file_id
+                    for relative_path, file_id in installed_files.items()
+                    if relative_path not in file_ids
+                }
+
+                if not (added or changed or removed):
+                    log.info("Package %s is already up to date", package_name)
+                    self.pkg_launch = "Up To Date"
+                    return self.pkg_launch
+
+                # The applet embeds its assets (or their URLs), so render it again
+                # whenever any of them changes
+                capp_member = next(
+                    (
+                        member
+                        for member in members
+                        if member.filename[len(package_dir) :]
+                        == f"{package_name}_capp.html"
+                    ),
+                    None,
+                )
+                tool_path = f"{package_name}_capp.py"
+                if (
+                    capp_member
+                    and capp_member not in added + changed
+                    and (
+                        removed
+                        or any(
+                            member.filename[len(package_dir) :] != tool_path
+                            for member in added + changed
+                        )
+                    )
+                ):
+                    changed.append(capp_member)
+
+                with timed(
+                    "extract", package=package_name, files=len(added) + len(changed)
+                ):
+                    records, sources, tool_content, version = (
+                        self.extract_package_files(
+                            zip_ref,
+                            package_name,
+                            package_dir,
+                            added + changed,
+                            file_ids,
+                            {
+                                relative_path: source["sha256"]
+                                for relative_path, source in installed_sources.items()
+                                if relative_path in file_ids and "sha256" in source
+                            },
+                        )
+                    )
+                blobs = [source["blob"] for source in sources.values()]
+
+                self.install_runtime(zip_ref, package_dir, tool_content)
+
+            added_ids = set(file_ids[m.filename[len(package_dir) :]] for m in added)
+            # One transaction, so a failure never leaves rows behind that point at
+            # blobs the error path releases
+            with timed("register", package=package_name, files=len(records)):
+                self.write_files(
+                    inserted=[r for r in records if r["id"] in added_ids],
+                    updated=[r for r in records if r["id"] not in added_ids],
+                    deleted=list(removed.values()),
+                )
 
-            # Install the package again (which will also install the tool)
-            self.install_package(package_name)
+            # The rows now point at the new blobs, let go of the ones they replaced
+            replaced = [*removed, *sources]
+            self.blobs.release(
+                [
+                    installed_sources[relative_path]["blob"]
+                    for relative_path in replaced
+                    if "blob" in installed_sources.get(relative_path, {})
+                ]
+            )
+            blobs = []
+            for relative_path in removed:
+                # Packages installed before the blob store have their own copies
+                file_path = os.path.join(dst_dir, relative_path)
+                if self.is_safe_path(relative_path) and os.path.exists(file_path):
+                    os.remove(file_path)
+
+            sources = {
+                **{
+                    relative_path: source
+                    for relative_path, source in installed_sources.items()
+                    if relative_path in file_ids
+                },
+                **sources,
+            }
+            tool_id = package.get("tool_id")
+            description = package.get("description")
+            parsed_meta = None
+            if tool_content is not None:
+                parsed_meta = self.get_tool_meta(tool_content)
+                tool_meta = self.build_tool_meta(
+                    package_name, tool_content, parsed_meta
+                )
+                description = tool_meta.description
+                with timed("tool", package=package_name):
+                    tool = self.update_tool_content(
+                        package_name, tool_content, tool_meta, tool_id
+                    )
+                tool_id = tool.id if tool else tool_id
+
+            self.index.set_package(
+                self.user_id,
+                package_name,
+                file_ids,
+                sources,
+                parsed_meta,
+                version=version or package.get("version"),
+                tool_id=tool_id,
+                tool_sha256=package.get("tool_sha256"),
+                description=description,
+                installed_at=package.get("installed_at", int(time.time())),
+                updated_at=int(time.time()),
+            )
 
-            print(f"Package {package_name} updated successfully.")
+            self.notify_runtime(package_name, file_ids, description)
+            log.info(
+                "Package %s updated successfully: %s added, %s changed, %s removed",
+                package_name,
+                len(added),
+                len(changed),
+                len(removed),
+            )
             self.pkg_launch = "Updated"
+            return self.pkg_launch
         except Exception as e:
-            print(f"Error updating package {package_name}: {str(e)}")
+            log.error("Error updating package %s: %s", package_name, e)
+            self.blobs.release(blobs)
             self.pkg_launch = "Update Failed"
             raise Exception(f"Error updating package {package_name}: {str(e)}")
 
-    def uninstall_package(self, package_name: str):
-        package_dir = os.path.join(UPLOAD_DIR, "cerebro", "plugins", package_name)
-        if not os.path.exists(package_dir):
-            print(f"Package {package_name} does not exist.")
-            return
+    def run_batch(
+        self,
+        action,
+        package_names: List[str],
+        failed_status: str,
+        archive_path: Optional[str] = None,
+    ):
+        """
+        Run install_package or update_package for several packages. The archive is
+        fetched once and the packages are extracted and registered on a worker pool.
+        """
+        package_names = list(dict.fromkeys(package_names))
+        if not archive_path:
+            with timed("download", url=self.valves.package_repo_url):
+                archive_path = self.fetch_archive(self.valves.package_repo_url)
+        self.ensure_index(self.user_id)
 
-        try:
-            # Get all files
-            all_files = Files.get_files()
-
-            # Filter files related to the package
-            files_to_delete = [
-                file
-                for file in all_files
-                if file.user_id == self.user_id
-                and f"/cerebro/plugins/{package_name}/" in file.filename
+        def run(package_name: str) -> str:
+            try:
+                return action(package_name, archive_path)
+            except Exception:
+                # Already logged by install_package or update_package
+                return failed_status
+
+        max_workers = max(1, min(self.valves.max_workers, len(package_names)))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # Workers do not inherit context variables, so hand each one a copy
+            futures = [
+                pool.submit(contextvars.copy_context().run, run, package_name)
+                for package_name in package_names
             ]
+            self.batch_results = {
+                package_name: future.result()
+                for package_name, future in zip(package_names, futures)
+            }
+
+        self.pkg_launch = "batch"
+        return self.batch_results
 
-            # Delete files from the database
-            deleted_count = 0
-            for file in files_to_delete:
-                if Files.delete_file_by_id(file.id):
-                    deleted_count += 1
-                print(f"Deleted file: {file.filename}")
+    def uninstall_package(self, package_name: str):
+        if not self.is_package_installed(package_name):
+            log.warning("Package %s does not exist", package_name)
+            return
 
-            print(f"Deleted {deleted_count} files from the database.")
+        try:
+            # Look up the package's files in the index
+            package = self.index.remove_package(self.user_id, package_name)
+            tool_id = package.get("tool_id")
+            self.notify_runtime(package_name)
+
+            # Delete files from the database in one transaction
+            with timed("deregister", package=package_name):
+                deleted_count = self.deregister_files(list(package["files"].values()))
+
+            log.info("Deleted %s files from the database", deleted_count)
+
+            # Drop the package's references to its blobs, deleting those no other
+            # package or user shares
+            sources = package.get("sources", {}).values()
+            deleted_blobs = self.blobs.release(
+                [source["blob"] for source in sources if "blob" in source]
+            )
+            log.info("Deleted %s unused blobs", deleted_blobs)
 
-            # Remove files and directories from the file system
+            # Packages installed before the blob store have their own directory
+            package_dir = os.path.join(UPLOAD_DIR, "cerebro", "plugins", package_name)
             if os.path.exists(package_dir):
                 shutil.rmtree(package_dir)
-                print(f"Removed package directory: {package_dir}")
-            else:
-                print(f"Package directory {package_dir} does not exist.")
+                log.info("Removed package directory: %s", package_dir)
 
             # Uninstall tool
-            tools = Tools.get_tools()
-            tool_name = (
-                f"cer_{package_name}"  # Look for the tool with the "cer_" prefix
-            )
-            tool = next((t for t in tools if t.name == tool_name), None)
-
-            if tool:
-                if Tools.delete_tool_by_id(tool.id):
-                    print(
-                        f"Tool {tool_name} for package {package_name} uninstalled successfully."
+            tool_name = f"cer_{package_name}"
+            if tool_id:
+                if Tools.delete_tool_by_id(tool_id):
+                    log.info(
+                        "Tool %s for package %s uninstalled successfully",
+                        tool_name,
+                        package_name,
                     )
                 else:
-                    print(
-                        f"Failed to uninstall tool {tool_name} for package {package_name}."
+                    log.error(
+                        "Failed to uninstall tool %s for package %s",
+                        tool_name,
+                        package_name,
                     )
             else:
-                print(
-                    f"No tool found with name {tool_name} for package {package_name}."
+                log.info(
+                    "No tool found with name %s for package %s", tool_name, package_name
                 )
 
-            print(f"Package {package_name} uninstalled successfully.")
+            log.info("Package %s uninstalled successfully", package_name)
             self.pkg_launch = "Uninstalled"
         except Exception as e:
             raise Exception(f"Error uninstalling package {package_name}: {str(e)}")
 
     def list_packages(self, body: dict) -> List[str]:
         if not self.user_id:
-            print("User ID is not set. Cannot list packages.")
-            return []
-
-        plugins_dir = os.path.join(UPLOAD_DIR, "cerebro", "plugins")
-        if not os.path.exists(plugins_dir):
-            print("Plugins directory does not exist.")
+            log.warning("User ID is not set. Cannot list packages")
             return []
 
-        self.packages = [
-            d
-            for d in os.listdir(plugins_dir)
-            if os.path.isdir(os.path.join(plugins_dir, d))
-        ]
-
-        # Update installed packages based on both directory existence and database entries
-        all_files = Files.get_files()
-        db_packages = set(
-            [
-                file.filename.split("/cerebro/plugins/")[1].split("/")[0]
-                for file in all_files
-                if file.user_id == self.user_id and "/cerebro/plugins/" in file.filename
-            ]
-        )
-
-        self.installed_pkgs = list(set(self.packages) | db_packages)
-
-        print(f"\n\n\nPackages list: {self.installed_pkgs}\n\n\n")
+        self.ensure_index(self.user_id)
+        records = self.index.records(self.user_id)
+        self.packages = [record["name"] for record in records]
+        log.debug("Installed packages for user %s: %s", self.user_id, self.packages)
 
         self.pkg_launch = "list"
-        return self.installed_pkgs
-
-    def list_packages(self, body: dict) -> List[str]:
-        if not self.user_id:
-            print("User ID is not set. Cannot list packages.")
-            return []
-
-        plugins_dir = os.path.join(UPLOAD_DIR, "cerebro", "plugins")
-        if not os.path.exists(plugins_dir):
-            print("Plugins directory does not exist.")
-            return []
-
-        self.packages = [
-            d
-            for d in os.listdir(plugins_dir)
-            if os.path.isdir(os.path.join(plugins_dir, d))
+        self.installed_pkgs = [
+            (
+                f"{record['name']} v{record['version']}"
+                if record.get("version")
+                else record["name"]
+            )
+            for record in records
         ]
-        print(f"\n\n\nPackages list: {self.packages}\n\n\n")
-
-        self.pkg_launch = "list"
-        self.installed_pkgs = self.packages
         return self.packages
 
     def check_package_exists(self, package_name: str) -> bool:
-        package_dir = os.path.join(
-            UPLOAD_DIR, "cerebro", "plugins", package_name.replace("_capp.html", "")
+        return self.is_package_installed(package_name.replace("_capp.html", ""))
+
+    async def run_package_command(
+        self, action, package_names: List[str], failed_status: str
+    ):
+        """
+        Fetch the archive without blocking the event loop, then run the install or
+        update for the given packages in the default executor.
+        """
+        with timed("download", url=self.valves.package_repo_url):
+            archive_path = await self.fetch_archive_async(self.valves.package_repo_url)
+        if len(package_names) == 1:
+            return await asyncio.to_thread(action, package_names[0], archive_path)
+        return await asyncio.to_thread(
+            self.run_batch, action, package_names, failed_status, archive_path
         )
-        return os.path.exists(package_dir)
 
-    def inlet(self, body: dict, __user__: Optional[dict] = None) -> dict:
-        print(f"inlet:{__name__}")
-        print(f"inlet:body:{body}")
-        print(f"inlet:user:{__user__}")
+    def get_request_key(self, body: dict, __user__: Optional[dict] = None) -> tuple:
+        """
+        Key a command's context by user and command text. Open WebUI strips chat_id
+        from the body inlet sees, but both hooks get the user's message.
+        """
+        command = next(
+            (
+                message.get("content")
+                for message in reversed(body.get("messages") or [])
+                if message.get("role") == "user"
+            ),
+            None,
+        )
+        if not isinstance(command, str):
+            command = None
+        return ((__user__ or {}).get("id"), command)
+
+    async def inlet(self, body: dict, __user__: Optional[dict] = None) -> dict:
+        # Every chat message passes through here; leave anything that is not a
+        # package command untouched without formatting or printing it
+        messages = body.get("messages")
+        if not messages:
+            return body
+        last_message = messages[-1].get("content")
+        if not isinstance(last_message, str) or not last_message.startswith("owui "):
+            return body
+
+        level = logging.getLevelName(self.valves.log_level.upper())
+        if isinstance(level, int):
+            log.setLevel(level)
+        log.debug("inlet body=%s user=%s", body, __user__)
+
+        context = RequestContext()
+        token = current_request.set(context)
+        command = (last_message.split() + [""])[1]
+        if command not in self.SUPPORTED_COMMANDS:
+            command = "invalid"
+        start = time.perf_counter()
+        try:
+            await self.dispatch_command(body, __user__)
+        except Exception:
+            metrics.inc("commands_total", command=command, status="error")
+            raise
+        else:
+            self.record_command(command)
+        finally:
+            current_request.reset(token)
+            metrics.observe(
+                "command_duration_seconds",
+                time.perf_counter() - start,
+                command=command,
+            )
+            # Writing the file blocks, keep it off the event loop
+            await asyncio.to_thread(metrics.export)
 
+        # Hand the result to this chat's outlet
+        if context.pkg_launch is not False:
+            self.contexts.put(self.get_request_key(body, __user__), context)
+        return body
+
+    def record_command(self, command: str):
+        """
+        Count the outcome of a command, per package for batches.
+        """
+        if self.pkg_launch == "batch":
+            for status in self.batch_results.values():
+                metrics.inc("commands_total", command=command, status=status)
+        elif self.pkg_launch is True:
+            metrics.inc("commands_total", command=command, status="Launched")
+        elif self.pkg_launch:
+            metrics.inc("commands_total", command=command, status=self.pkg_launch)
+
+    async def dispatch_command(self, body: dict, __user__: Optional[dict] = None):
         if __user__ and "id" in __user__:
             self.user_id = __user__["id"]
         else:
-            print("Warning: No valid user ID provided")
+            log.warning("No valid user ID provided")
 
         messages = body.get("messages", [])
         if messages:
@@ -597,79 +2497,89 @@ class Filter:
                             else None
                         )
                         file_name = f"{package_name}_capp.html"
-                        print(
-                            f"Running command with file name: {file_name} and URL: {url}"
+                        log.info(
+                            "Running command with file name: %s and URL: %s",
+                            file_name,
+                            url,
                         )
 
-                        if not self.check_package_exists(file_name):
+                        if not await asyncio.to_thread(
+                            self.check_package_exists, file_name
+                        ):
                             self.pkg_launch = "none"
 
-                        self.handle_package(package_name, url, file_name)
+                        with timed("run", package=package_name):
+                            await self.handle_package_async(
+                                package_name, url, file_name
+                            )
                         self.pkg_launch = True
 
                 elif last_message.startswith("owui install"):
                     command_parts = last_message.split()
                     if len(command_parts) >= 3:
-                        package_name = command_parts[2]
-                        print(f"Installing package: {package_name}")
-                        self.install_package(package_name)
+                        log.info("Installing packages: %s", command_parts[2:])
+                        await self.run_package_command(
+                            self.install_package, command_parts[2:], "Install Failed"
+                        )
 
                 elif last_message.startswith("owui uninstall"):
                     command_parts = last_message.split()
                     if len(command_parts) >= 3:
                         package_name = " ".join(command_parts[2:])
-                        print(f"Uninstalling package: {package_name}")
-                        self.uninstall_package(package_name)
+                        log.info("Uninstalling package: %s", package_name)
+                        await asyncio.to_thread(self.uninstall_package, package_name)
 
                 elif last_message.startswith("owui list"):
-                    self.list_packages(body)
+                    await asyncio.to_thread(self.list_packages, body)
 
                 elif last_message.startswith("owui update"):
                     command_parts = last_message.split()
                     if len(command_parts) >= 3:
-                        package_name = " ".join(command_parts[2:])
-                        print(f"Updating package: {package_name}")
-                        self.update_package(package_name)
-
-        return body
+                        log.info("Updating packages: %s", command_parts[2:])
+                        await self.run_package_command(
+                            self.update_package, command_parts[2:], "Update Failed"
+                        )
 
     def outlet(self, body: dict, __user__: Optional[dict] = None) -> dict:
-        print(f"outlet:{__name__}")
-        print(f"outlet:body:{body}")
-        print(f"outlet:user:{__user__}")
+        # Nothing to render unless some inlet left a command result behind
+        if not self.contexts:
+            return body
+
+        log.debug("outlet body=%s user=%s", body, __user__)
+
+        context = self.contexts.pop(self.get_request_key(body, __user__))
+        if not context:
+            return body
 
+        token = current_request.set(context)
+        try:
+            self.render_result(body)
+        finally:
+            current_request.reset(token)
+
+        return body
+
+    def render_result(self, body: dict):
         if self.pkg_launch is True:
             if self.file:
                 body["messages"][-1]["content"] = f"{{{{HTML_FILE_ID_{self.file}}}}}"
             else:
-                print("Error: File ID not set after handling package")
+                log.error("File ID not set after handling package")
                 body["messages"][-1]["content"] = "Error: Unable to load package"
-        elif self.pkg_launch == "Installed":
-            body["messages"][-1]["content"] = "Package Installed"
-        elif self.pkg_launch == "Already Installed":
-            body["messages"][-1]["content"] = "Package Already Installed"
-        elif self.pkg_launch == "Uninstalled":
-            body["messages"][-1]["content"] = "Package Uninstalled"
-        elif self.pkg_launch == "Updated":
-            body["messages"][-1]["content"] = "Package Updated Successfully"
-        elif self.pkg_launch == "Update Failed":
-            body["messages"][-1]["content"] = "Package Update Failed"
-        elif self.pkg_launch == "Not Installed":
-            body["messages"][-1]["content"] = "Package Not Installed. Cannot Update."
+        elif self.pkg_launch == "batch":
+            body["messages"][-1]["content"] = "\n".join(
+                f"{package_name}: {self.STATUS_MESSAGES.get(status, status)}"
+                for package_name, status in self.batch_results.items()
+            )
+        elif self.pkg_launch in self.STATUS_MESSAGES:
+            body["messages"][-1]["content"] = self.STATUS_MESSAGES[self.pkg_launch]
         elif self.pkg_launch == "list":
             body["messages"][-1]["content"] = (
                 "--- INSTALLED PACKAGES--- \n" + "\n".join(self.installed_pkgs)
             )
-        elif self.pkg_launch == "none":
-            body["messages"][-1]["content"] = "Package Not installed"
         elif self.pkg_launch == "invalid":
             body["messages"][-1][
                 "content"
             ] = f"Invalid command. Supported commands are: {', '.join(self.SUPPORTED_COMMANDS)}"
         else:
             pass
-
-        self.pkg_launch = False
-
-        print("\n\n\n")
-        return body
@@ -0,0 +1,357 @@
+"""
+title: Cerebro Applet Runtime
+author: Andrew Tait Gehrhardt
+author_url: https://github.com/atgehrhardt/Cerebro-OpenWebUI-Package-Manager
+funding_url: https://github.com/open-webui
+version: 0.3.0
+
+Shared helpers for the applet tools (`*_capp.py`) installed by the Cerebro Package Manager.
+The package manager copies this module to UPLOAD_DIR/cerebro/lib whenever it installs a
+package, so tools can import it with:
+
+    sys.path.append(os.path.join(UPLOAD_DIR, "cerebro", "lib"))
+    from cerebro_applet import launch_applet
+
+It also keeps the registry of installed applets used by the Cerebro Tool Launcher.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from config import UPLOAD_DIR
+
+INDEX_DIR = os.path.join(UPLOAD_DIR, "cerebro", "index")
+METRICS_DIR = os.path.join(UPLOAD_DIR, "cerebro", "metrics")
+
+log = logging.getLogger("cerebro.applet")
+
+
+class AppletRegistry:
+    """
+    Installed applets per user: package name -> file ID of the package's _capp.html,
+    along with the tool descriptions the package manager recorded at install time.
+
+    A user's registry is read from their package index the first time it is needed and
+    then kept current by the package manager's install and remove events. A name that
+    is not in the registry is rejected without touching the database; the index is
+    only re-read if its file changed since it was loaded (e.g. by another worker).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> (index mtime_ns when loaded, {package_name: applet file ID},
+        #             {package_name: description})
+        self._users: Dict[
+            str, Tuple[Optional[int], Dict[str, str], Dict[str, Optional[str]]]
+        ] = {}
+
+    def _index_path(self, user_id: str) -> str:
+        return os.path.join(INDEX_DIR, f"{user_id}.json")
+
+    def _mtime(self, user_id: str) -> Optional[int]:
+        try:
+            return os.stat(self._index_path(user_id)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self, user_id: str) -> tuple:
+        mtime = self._mtime(user_id)
+        try:
+            with open(self._index_path(user_id), "r", encoding="utf-8") as f:
+                packages = json.load(f)["packages"]
+        except FileNotFoundError:
+            # No packages installed. The package manager indexes users with older
+            # installs on their next command, so this never needs to scan the files
+            # table, which would otherwise happen on every chat turn
+            return mtime, {}, {}
+
+        applets = {}
+        descriptions = {}
+        for package_name, package in packages.items():
+            file_id = package["files"].get(f"{package_name}_capp.html")
+            if file_id:
+                applets[package_name] = file_id
+                descriptions[package_name] = package.get("description")
+        return mtime, applets, descriptions
+
+    def _entry(self, user_id: str, refresh: bool = False) -> tuple:
+        entry = self._users.get(user_id)
+        if entry is None or (refresh and entry[0] != self._mtime(user_id)):
+            entry = self._load(user_id)
+            with self._lock:
+                self._users[user_id] = entry
+        return entry
+
+    def loaded(self, user_id: str) -> bool:
+        return user_id in self._users
+
+    def _applets(self, user_id: str, refresh: bool = False) -> Dict[str, str]:
+        return self._entry(user_id, refresh)[1]
+
+    def get(self, user_id: str, package_name: str) -> Optional[str]:
+        file_id = self._applets(user_id).get(package_name)
+        if file_id is None:
+            file_id = self._applets(user_id, refresh=True).get(package_name)
+        return file_id
+
+    def lookup(self, user_id: str, package_names: List[str]) -> Dict[str, str]:
+        """
+        Return {package_name: applet file ID} for the installed packages among
+        package_names.
+        """
+        applets = self._applets(user_id)
+        if any(package_name not in applets for package_name in package_names):
+            applets = self._applets(user_id, refresh=True)
+        return {
+            package_name: applets[package_name]
+            for package_name in package_names
+            if package_name in applets
+        }
+
+    def descriptions(self, user_id: str) -> Dict[str, Optional[str]]:
+        """
+        Return {package_name: description} for the user's installed applets. The same
+        dict is returned until the installed set changes, so callers can cache
+        anything derived from it by identity.
+        """
+        return self._entry(user_id, refresh=True)[2]
+
+    def add(
+        self,
+        user_id: str,
+        package_name: str,
+        file_id: str,
+        description: Optional[str] = None,
+    ):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users[user_id] = (
+                    entry[0],
+                    {**entry[1], package_name: file_id},
+                    {**entry[2], package_name: description},
+                )
+
+    def remove(self, user_id: str, package_name: str):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                applets = dict(entry[1])
+                applets.pop(package_name, None)
+                descriptions = dict(entry[2])
+                descriptions.pop(package_name, None)
+                self._users[user_id] = (entry[0], applets, descriptions)
+
+    def clear(self, user_id: Optional[str] = None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+
+registry = AppletRegistry()
+
+
+def resolve_applet_file_id(user_id: str, package_name: str) -> Optional[str]:
+    """
+    Return the file ID of a package's applet HTML for the given user, or None if the
+    package is not installed for them.
+    """
+    return registry.get(user_id, package_name)
+
+
+class AppletNotInstalled(LookupError):
+    pass
+
+
+async def launch_applet(
+    user_id: str,
+    package_name: str,
+    __event_emitter__: Callable[[dict], Awaitable],
+    work: Optional[Callable[[], Awaitable]] = None,
+    progress: Optional[str] = None,
+    min_display_time: float = 0,
+) -> Any:
+    """
+    Replace the tool's message with the embed of the user's applet for package_name,
+    and return the result of `work`, an optional coroutine function for anything the
+    tool needs done first (e.g. fetching data).
+
+    The progress message is only shown while something is actually pending: `work`,
+    or reading the user's registry the first time. Once shown it stays up for at
+    least min_display_time seconds. Raises AppletNotInstalled if the package is not
+    installed for the user.
+    """
+    loop = asyncio.get_running_loop()
+    shown_at = None
+
+    async def show_progress():
+        nonlocal shown_at
+        if shown_at is None:
+            shown_at = loop.time()
+            message = progress or f"Launching {package_name}..."
+            await __event_emitter__({"type": "replace", "data": {"content": message}})
+
+    if registry.loaded(user_id):
+        file_id = registry.get(user_id, package_name)
+    else:
+        await show_progress()
+        file_id = await asyncio.to_thread(registry.get, user_id, package_name)
+    if not file_id:
+        raise AppletNotInstalled(
+            f"Error: Applet file for {package_name} not found. Make sure the package is installed."
+        )
+
+    result = None
+    if work:
+        await show_progress()
+        result = await work()
+
+    if shown_at is not None:
+        remaining = min_display_time - (loop.time() - shown_at)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+    await __event_emitter__(
+        {"type": "replace", "data": {"content": f"{{{{HTML_FILE_ID_{file_id}}}}}"}}
+    )
+    return result
+
+
+def package_installed(
+    user_id: str,
+    package_name: str,
+    applet_file_id: str,
+    description: Optional[str] = None,
+):
+    """
+    Event sent by the package manager after it installs or updates a package.
+    """
+    registry.add(user_id, package_name, applet_file_id, description)
+
+
+def package_removed(user_id: str, package_name: str):
+    """
+    Event sent by the package manager after it uninstalls a package.
+    """
+    registry.remove(user_id, package_name)
+
+
+def invalidate(user_id: Optional[str] = None, package_name: Optional[str] = None):
+    """
+    Drop cached applets so they are re-read from the package index; with no arguments
+    every user's registry is cleared.
+    """
+    registry.clear(user_id)
+
+
+class Metrics:
+    """
+    In-memory counters and latency histograms, written out in the Prometheus text
+    format to UPLOAD_DIR/cerebro/metrics/<component>.prom, ready for a node_exporter
+    textfile collector. Used by the launcher. The package manager keeps its own copy
+    with the same layout, since it records from before the runtime is installed.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, namespace: str, path: str):
+        self.namespace = namespace
+        self.path = path
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # Cumulative bucket counts followed by the sum and the total count
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @staticmethod
+    def format_labels(labels: tuple) -> str:
+        if not labels:
+            return ""
+        escaped = (
+            (
+                key,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for key, value in labels
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in series.items():
+                    lines.append(f"{metric}{self.format_labels(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, counts in series.items():
+                    for bound, count in zip(
+                        self.BUCKETS + ("+Inf",), counts[:-2] + counts[-1:]
+                    ):
+                        bucket_labels = self.format_labels(labels + (("le", bound),))
+                        lines.append(f"{metric}_bucket{bucket_labels} {count}")
+                    lines.append(
+                        f"{metric}_sum{self.format_labels(labels)} {counts[-2]}"
+                    )
+                    lines.append(
+                        f"{metric}_count{self.format_labels(labels)} {counts[-1]}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """
+        Atomically replace the metrics file with the current values. Failing to write
+        metrics never fails the command that produced them.
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Could not write metrics to %s: %s", self.path, e)
+
+
+_metrics: Dict[str, Metrics] = {}
+
+
+def get_metrics(component: str) -> Metrics:
+    """
+    Return the metrics of a component (e.g. "launcher"), exported to
+    UPLOAD_DIR/cerebro/metrics/<component>.prom.
+    """
+    if component not in _metrics:
+        _metrics[component] = Metrics(
+            f"cerebro_{component}", os.path.join(METRICS_DIR, f"{component}.prom")
+        )
+    return _metrics[component]
@@ -7,92 +7,199 @@ version: 0.1.0
 """
 
 """
-EXAMPLE SYSTEM PROMPT:
+SYSTEM PROMPT:
 
-You have the ability to use tools to answer user queries. You can use the tools by responding with the command `owui run {tool_name}`
-
-If you use a tool ONLY RESPOND WITH THE COMMANDS AND NOTHING ELSE!
-You have access to the below tools:
-- package_name: LLM friendly description
-- package_name: LLM friendly description
-- package_name: LLM friendly description
-
-You can use multiple tools by responding:
-owui run {tool_name1} 
-owui run {tool_name2}
-
-If the user is not inquiring about a topic that needs a tool, then you should NOT use one!
-
-You should never use a tool if all the user says is "Thanks" or "thanks".
+The launcher adds the prompt below to every chat's system prompt, listing the packages
+installed for the user with the description from each tool's class docstring. It is
+rebuilt only when the installed packages change. Turn off the `system_prompt` valve to
+write your own instead.
 """
 
 from typing import List, Dict, Optional
+from pydantic import BaseModel, Field
 import re
 import uuid
+import importlib
+import logging
+import os
+import sys
+import time
 from apps.webui.models.files import Files
 import requests
 
+from config import UPLOAD_DIR
+
+log = logging.getLogger("cerebro.launcher")
+
+CEREBRO_LIB_DIR = os.path.join(UPLOAD_DIR, "cerebro", "lib")
+
+
+def load_runtime():
+    """
+    Import the applet runtime, which the package manager installs along with the
+    first package. Returns None until then.
+    """
+    if "cerebro_applet" not in sys.modules:
+        # Only put the directory on sys.path once it exists, or the import system
+        # caches the miss for the rest of the process
+        if not os.path.exists(os.path.join(CEREBRO_LIB_DIR, "cerebro_applet.py")):
+            return None
+        if CEREBRO_LIB_DIR not in sys.path:
+            sys.path.append(CEREBRO_LIB_DIR)
+    # Unlike reading sys.modules, this waits for an import another thread is still
+    # running instead of handing out a partially initialized module
+    try:
+        return importlib.import_module("cerebro_applet")
+    except ImportError:
+        return None
+
 
 class Filter:
+    OWUI_RUN_PATTERN = re.compile(r"owui run (\w+)")
+
+    SYSTEM_PROMPT = """You have the ability to use tools to answer user queries. You can use the tools by responding with the command `owui run {{tool_name}}`
+
+If you use a tool ONLY RESPOND WITH THE COMMANDS AND NOTHING ELSE!
+You have access to the below tools:
+{tools}
+
+You can use multiple tools by responding:
+owui run {{tool_name1}}
+owui run {{tool_name2}}
+
+If the user is not inquiring about a topic that needs a tool, then you should NOT use one!
+
+You should never use a tool if all the user says is "Thanks" or "thanks"."""
+
+    class Valves(BaseModel):
+        log_level: str = Field(
+            default="INFO",
+            description="Log level: DEBUG, INFO, WARNING or ERROR. DEBUG also logs request bodies.",
+        )
+        system_prompt: bool = Field(
+            default=True,
+            description="Add the list of installed tools to the system prompt.",
+        )
+
     def __init__(self):
-        self.file = None
+        self.valves = self.Valves()
         self.user_id = None
+        # user_id -> (registry descriptions it was built from, prompt)
+        self.system_prompts: Dict[str, tuple] = {}
 
     def inlet(self, body: dict, __user__: Optional[dict] = None) -> dict:
-        print(f"inlet:{__name__}")
-        print(f"inlet:body:{body}")
-        print(f"inlet:user:{__user__}")
+        log.debug("inlet body=%s user=%s", body, __user__)
         if __user__ and "id" in __user__:
             self.user_id = __user__["id"]
         else:
-            print("Warning: No valid user ID provided")
+            log.warning("No valid user ID provided")
+            return body
+
+        if self.valves.system_prompt:
+            prompt = self.get_system_prompt(self.user_id)
+            if prompt:
+                self.add_system_prompt(body, prompt)
         return body
 
-    def handle_package(self, package_name: str):
-        files = Files.get_files()
-        files = [file for file in files if file.user_id == self.user_id]
-        files = [
-            file
-            for file in files
-            if file.filename.endswith(f"{package_name}_capp.html")
-        ]
-        print("Files: ", files)
-        if files:
-            self.file = files[0].id
-            print(f"\nFound file: {self.file}\n")
-            return True
+    def get_system_prompt(self, user_id: str) -> Optional[str]:
+        """
+        Return the tool prompt for the user's installed packages, or None if nothing is
+        installed. The prompt is cached until the installed set changes.
+        """
+        runtime = load_runtime()
+        if not runtime or not hasattr(runtime, "registry"):
+            return None
+
+        descriptions = runtime.registry.descriptions(user_id)
+        cached = self.system_prompts.get(user_id)
+        if cached and cached[0] is descriptions:
+            return cached[1]
+
+        prompt = None
+        if descriptions:
+            tools = "\n".join(
+                f"- {package_name}: "
+                + " ".join((description or f"Tool for {package_name}").split())
+                for package_name, description in sorted(descriptions.items())
+            )
+            prompt = self.SYSTEM_PROMPT.format(tools=tools)
+        self.system_prompts[user_id] = (descriptions, prompt)
+        return prompt
+
+    def add_system_prompt(self, body: dict, prompt: str):
+        messages = body.get("messages")
+        if not isinstance(messages, list):
+            return
+        if messages and messages[0].get("role") == "system":
+            content = messages[0].get("content") or ""
+            if prompt not in content:
+                messages[0]["content"] = f"{content}\n\n{prompt}" if content else prompt
         else:
-            print(f"No matching file found for package: {package_name}")
-            return False
+            messages.insert(0, {"role": "system", "content": prompt})
+
+    def resolve_packages(
+        self, package_names: List[str], user_id: str
+    ) -> Dict[str, str]:
+        """
+        Map each installed package in package_names to the file ID of its applet HTML,
+        with a single pass over the file table. Only used until the applet runtime,
+        and with it the registry of installed applets, is available.
+        """
+        wanted = {
+            f"{package_name}_capp.html": package_name for package_name in package_names
+        }
+        file_ids = {}
+        for file in Files.get_files():
+            if file.user_id != user_id:
+                continue
+            package_name = wanted.get(file.filename.rpartition("/")[2])
+            if package_name and package_name not in file_ids:
+                file_ids[package_name] = file.id
+        return file_ids
 
     def outlet(self, body: dict, __user__: Optional[dict] = None) -> dict:
-        print(f"outlet:{__name__}")
-        print(f"outlet:body:{body}")
-        print(f"outlet:user:{__user__}")
-        messages = body.get("messages", [])
-        if messages:
-            last_message = messages[-1]["content"]
-            owui_run_matches = re.finditer(r"owui run (\w+)", last_message)
-
-            new_content = last_message
-            for match in owui_run_matches:
-                package_name = match.group(1)
-                print(f"Detected 'owui run' command for package: {package_name}")
-                if self.handle_package(package_name):
-                    if self.file:
-                        replacement = f"{{{{HTML_FILE_ID_{self.file}}}}}"
-                        new_content = new_content.replace(match.group(0), replacement)
-                        self.file = None  # Reset file ID after use
-                    else:
-                        print(
-                            f"Error: File ID not set after handling package {package_name}"
-                        )
-                        replacement = f"Error: Unable to load package {package_name}"
-                        new_content = new_content.replace(match.group(0), replacement)
-                else:
-                    print(f"Error: Failed to handle package {package_name}")
-                    replacement = f"Error: Failed to load package {package_name}"
-                    new_content = new_content.replace(match.group(0), replacement)
-
-            messages[-1]["content"] = new_content
+        # Skip replies that do not run a tool before formatting or scanning anything
+        messages = body.get("messages")
+        if not messages:
+            return body
+        last_message = messages[-1].get("content")
+        if not isinstance(last_message, str) or "owui run " not in last_message:
+            return body
+
+        level = logging.getLevelName(self.valves.log_level.upper())
+        if isinstance(level, int):
+            log.setLevel(level)
+        log.debug("outlet body=%s user=%s", body, __user__)
+        package_names = list(dict.fromkeys(self.OWUI_RUN_PATTERN.findall(last_message)))
+        if not package_names:
+            return body
+        log.info("Detected 'owui run' command for packages: %s", package_names)
+
+        runtime = load_runtime()
+        metrics = runtime.get_metrics("launcher") if runtime else None
+
+        user_id = (__user__ or {}).get("id") or self.user_id
+        start = time.perf_counter()
+        if runtime and hasattr(runtime, "registry"):
+            file_ids = runtime.registry.lookup(user_id, package_names)
+        else:
+            file_ids = self.resolve_packages(package_names, user_id)
+        if metrics:
+            metrics.observe("lookup_duration_seconds", time.perf_counter() - start)
+            metrics.inc("lookups_total", len(file_ids), result="found")
+            metrics.inc(
+                "lookups_total", len(package_names) - len(file_ids), result="missing"
+            )
+
+        def replace(match: re.Match) -> str:
+            package_name = match.group(1)
+            file_id = file_ids.get(package_name)
+            if file_id:
+                return f"{{{{HTML_FILE_ID_{file_id}}}}}"
+            log.error("Failed to handle package %s", package_name)
+            return f"Error: Failed to load package {package_name}"
+
+        messages[-1]["content"] = self.OWUI_RUN_PATTERN.sub(replace, last_message)
+        if metrics:
+            metrics.export()
         return body
@@ -0,0 +1,48 @@
+"""
+Load the Cerebro filters against the in-memory Open WebUI stand-ins from
+benchmarks/fakes.py, with UPLOAD_DIR in a temporary directory.
+"""
+
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmarks"))
+
+import fakes  # noqa: E402
+
+UPLOAD_DIR = tempfile.mkdtemp(prefix="cerebro-tests-")
+FILES, TOOLS = fakes.install(UPLOAD_DIR)
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+cerebro = load_module("cerebro", os.path.join(ROOT_DIR, "src", "cerebro.py"))
+
+
+@pytest.fixture
+def upload_dir():
+    for name in os.listdir(UPLOAD_DIR):
+        shutil.rmtree(os.path.join(UPLOAD_DIR, name), ignore_errors=True)
+    fakes.reset(FILES, TOOLS)
+    sys.modules.pop("cerebro_applet", None)
+    return UPLOAD_DIR
+
+
+@pytest.fixture
+def package_manager(upload_dir):
+    return cerebro.Filter()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(UPLOAD_DIR, ignore_errors=True)
@@ -0,0 +1,43 @@
+import json
+import os
+
+from conftest import FILES, ROOT_DIR, load_module
+
+
+def load_registry():
+    runtime = load_module(
+        "cerebro_applet", os.path.join(ROOT_DIR, "src", "cerebro_applet.py")
+    )
+    return runtime, runtime.AppletRegistry()
+
+
+def test_user_without_an_index_has_no_applets(upload_dir):
+    _, registry = load_registry()
+
+    assert registry.descriptions("new-user") == {}
+    assert registry.get("new-user", "snake") is None
+    assert FILES.scans == 0
+
+
+def test_applets_are_read_from_the_index(upload_dir):
+    runtime, registry = load_registry()
+    assert registry.descriptions("test-user") == {}
+
+    os.makedirs(runtime.INDEX_DIR)
+    with open(os.path.join(runtime.INDEX_DIR, "test-user.json"), "w") as f:
+        json.dump(
+            {
+                "packages": {
+                    "snake": {
+                        "files": {"snake_capp.html": "1", "app.js": "2"},
+                        "description": "Launches a game of Snake",
+                    },
+                    "broken": {"files": {"app.js": "3"}},
+                }
+            },
+            f,
+        )
+
+    assert registry.get("test-user", "snake") == "1"
+    assert registry.descriptions("test-user") == {"snake": "Launches a game of Snake"}
+    assert FILES.scans == 0
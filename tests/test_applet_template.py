@@ -0,0 +1,30 @@
+from conftest import cerebro
+
+
+def test_placeholders_are_replaced_in_one_pass():
+    template = cerebro.AppletTemplate(
+        '<link href="{style.css}"><script src="{app.js}"></script>{app.js}'
+    )
+
+    assert template.references == ["style.css", "app.js", "app.js"]
+    assert template.render({"style.css": "/s", "app.js": "/a"}) == (
+        '<link href="/s"><script src="/a"></script>/a',
+        [],
+    )
+
+
+def test_placeholders_without_a_value_are_left_as_they_are():
+    template = cerebro.AppletTemplate('<img src="{logo.png}"><p>{app.js}</p>')
+
+    assert template.render({"app.js": "/a"}) == (
+        '<img src="{logo.png}"><p>/a</p>',
+        ["logo.png"],
+    )
+
+
+def test_template_literals_and_braces_are_not_placeholders():
+    source = "const url = `${base}/{id}`; if (x) { y(); } {config.json}"
+    template = cerebro.AppletTemplate(source)
+
+    assert template.references == ["config.json"]
+    assert template.render({}) == (source, ["config.json"])
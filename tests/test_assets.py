@@ -0,0 +1,70 @@
+import pytest
+
+FILE_IDS = {
+    "snake_capp.html": "1",
+    "app.js": "2",
+    "css/style.css": "3",
+}
+
+
+@pytest.mark.parametrize(
+    "reference, expected",
+    [
+        ("{app.js}", "app.js"),
+        (" app.js ", "app.js"),
+        ("./app.js", "app.js"),
+        ("css/style.css", "css/style.css"),
+        # Placeholders match on the basename
+        ("{style.css}", "css/style.css"),
+        ("style.css", "css/style.css"),
+        ("missing.js", None),
+        ("/app.js", None),
+        ("https://example.com/app.js", None),
+        ("data:text/javascript,1", None),
+        ("{app.js}?v=1{x}", None),
+    ],
+)
+def test_resolve_asset(package_manager, reference, expected):
+    assert package_manager.resolve_asset(reference, FILE_IDS) == expected
+
+
+def test_minify_css(package_manager):
+    css = "/* theme */\nbody {\n  color: red;\n}\n\na > b , c { margin: 0 }\n"
+
+    assert package_manager.minify_css(css) == "body{color: red;}a>b,c{margin: 0}"
+
+
+def test_minify_js_drops_comment_lines_and_blank_lines(package_manager):
+    js = "// setup\nconst a = 1;   \n\n    // step\nrun(a); // inline\n"
+
+    assert package_manager.minify_js(js) == "const a = 1;\nrun(a); // inline"
+
+
+@pytest.mark.parametrize(
+    "js",
+    [
+        "const src = `\n//cdn.example.com/lib.js\n\n`;\n// comment\n",
+        'const s = "first \\\n// second";\n// comment\n',
+    ],
+)
+def test_minify_js_leaves_multi_line_strings_alone(package_manager, js):
+    assert package_manager.minify_js(js) == js
+
+
+def test_asset_route_is_only_mounted_when_serving_assets(package_manager, monkeypatch):
+    mounted = []
+    monkeypatch.setattr(
+        package_manager, "mount_asset_route", lambda: mounted.append(True)
+    )
+    sha256 = "ab" * 32
+
+    assert package_manager.get_file_url("f1", sha256).endswith(
+        "/api/v1/files/f1/content?v=" + sha256[:16]
+    )
+    assert mounted == []
+
+    package_manager.valves.serve_assets = True
+    assert package_manager.get_file_url("f1", sha256).endswith(
+        "/api/v1/cerebro/assets/f1?v=" + sha256[:16]
+    )
+    assert mounted == [True]
@@ -0,0 +1,58 @@
+import json
+import multiprocessing
+import os
+
+from conftest import cerebro
+
+
+def add_blobs(root: str, count: int):
+    store = cerebro.BlobStore(root)
+    for _ in range(count):
+        store.add([b"shared content"], ".js")
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = cerebro.BlobStore(str(tmp_path))
+    first = store.add([b"console.log(1)"], ".JS")
+    second = store.add([b"console", b".log(1)"], ".js")
+
+    assert first == second
+    assert first[0].endswith(".js")
+    assert os.path.exists(store.path(first[0]))
+    with store.refs() as refs:
+        assert refs == {first[0]: 2}
+
+
+def test_blob_is_deleted_with_its_last_reference(tmp_path):
+    store = cerebro.BlobStore(str(tmp_path))
+    name = store.add([b"body {}"], ".css")[0]
+    other = store.add([b"<html></html>"], ".html")[0]
+    store.add([b"body {}"], ".css")
+
+    assert store.release([name]) == 0
+    assert os.path.exists(store.path(name))
+    assert store.release([name, other]) == 2
+    assert not os.path.exists(store.path(name))
+    assert not os.path.exists(store.path(other))
+    with store.refs() as refs:
+        assert refs == {}
+
+
+def test_releasing_an_unknown_blob_is_harmless(tmp_path):
+    store = cerebro.BlobStore(str(tmp_path))
+    assert store.release(["0" * 64 + ".js"]) == 0
+
+
+def test_references_from_several_processes_are_all_counted(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=add_blobs, args=(str(tmp_path), 25)) for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    with open(tmp_path / "refs.json", encoding="utf-8") as f:
+        assert list(json.load(f).values()) == [100]
@@ -0,0 +1,48 @@
+import json
+import multiprocessing
+
+from conftest import cerebro
+
+
+def add_files(root: str, package_name: str, count: int):
+    index = cerebro.PackageIndex(root)
+    for i in range(count):
+        index.add("alice", package_name, f"file{i}.js", f"{package_name}-{i}")
+
+
+def test_changes_from_several_processes_are_all_kept(tmp_path):
+    # Warm this process's cache first, so a stale copy would show
+    index = cerebro.PackageIndex(str(tmp_path))
+    index.add("alice", "main", "app.js", "main-0")
+
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=add_files, args=(str(tmp_path), f"pkg{i}", 25))
+        for i in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+    index.add("alice", "main", "style.css", "main-1")
+
+    with open(tmp_path / "alice.json", encoding="utf-8") as f:
+        packages = json.load(f)["packages"]
+    assert sorted(packages) == ["main", "pkg0", "pkg1", "pkg2", "pkg3"]
+    assert all(len(packages[f"pkg{i}"]["files"]) == 25 for i in range(4))
+    assert packages["main"]["files"] == {"app.js": "main-0", "style.css": "main-1"}
+
+
+def test_failed_change_is_not_kept(tmp_path):
+    index = cerebro.PackageIndex(str(tmp_path))
+    index.add("alice", "main", "app.js", "main-0")
+
+    try:
+        with index.update("alice") as manifest:
+            manifest["packages"].clear()
+            raise RuntimeError("failed")
+    except RuntimeError:
+        pass
+
+    assert index.packages("alice") == ["main"]
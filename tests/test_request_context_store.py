@@ -0,0 +1,55 @@
+from conftest import cerebro
+
+
+def make_context(user_id: str, age: float = 0):
+    context = cerebro.RequestContext(user_id)
+    context.created_at -= age
+    return context
+
+
+def test_context_is_handed_over_once():
+    store = cerebro.RequestContextStore()
+    context = make_context("alice")
+    store.put(("alice", "owui list"), context)
+
+    assert store.pop(("bob", "owui list")) is None
+    assert store.pop(("alice", "owui list")) is context
+    assert store.pop(("alice", "owui list")) is None
+    assert len(store) == 0
+
+
+def test_without_a_command_the_users_latest_context_is_taken():
+    store = cerebro.RequestContextStore()
+    first, second = make_context("alice"), make_context("alice")
+    store.put(("alice", "owui list"), first)
+    store.put(("alice", "owui run snake"), second)
+    store.put(("bob", "owui list"), make_context("bob"))
+
+    assert store.pop(("alice", None)) is second
+    assert store.pop(("alice", None)) is first
+    assert store.pop(("alice", None)) is None
+
+
+def test_oldest_contexts_are_dropped_beyond_max_size():
+    store = cerebro.RequestContextStore(max_size=2)
+    for i in range(3):
+        store.put(("alice", f"owui run {i}"), make_context("alice"))
+
+    assert len(store) == 2
+    assert store.pop(("alice", "owui run 0")) is None
+    assert store.pop(("alice", "owui run 2")) is not None
+
+
+def test_expired_contexts_are_dropped():
+    store = cerebro.RequestContextStore(ttl=60)
+    store.put(("alice", "owui list"), make_context("alice", age=120))
+    store.put(("bob", "owui list"), make_context("bob", age=30))
+
+    # Expired entries are evicted on the next put
+    assert len(store) == 1
+    assert store.pop(("alice", "owui list")) is None
+
+    store.put(("carol", "owui list"), make_context("carol"))
+    store._contexts[("carol", "owui list")].created_at -= 120
+    assert store.pop(("carol", "owui list")) is None
+    assert store.pop(("bob", "owui list")) is not None
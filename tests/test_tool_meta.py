@@ -0,0 +1,109 @@
+import glob
+import os
+
+import pytest
+
+from conftest import ROOT_DIR
+
+TOOL_TEMPLATE = '''
+class Tools:
+    """
+    Launches a test applet
+    """
+
+    class Valves(BaseModel):
+        priority: int = Field(default=0)
+        label: str = "x"
+
+    async def run({params}) -> str:
+        return ""
+'''
+
+
+@pytest.mark.parametrize(
+    "path", sorted(glob.glob(os.path.join(ROOT_DIR, "plugins", "*", "*_capp.py")))
+)
+def test_bundled_tools_parse_the_same_either_way(package_manager, path):
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    assert package_manager.parse_tool_meta(
+        content
+    ) == package_manager.parse_tool_meta_ast(content)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        "self",
+        "self, body: Optional[dict] = None, __user__: Optional[dict] = None",
+        "self, body: dict, x=dict(a=1), y: int = 2",
+        'self, sep: str = ")", other: str = "a, b"',
+        "self, mapping: Dict[str, int] = {}, *args, **kwargs",
+        "self, pair: Tuple[int, int] = (1, 2)",
+    ],
+)
+def test_run_params_match_ast(package_manager, params):
+    content = TOOL_TEMPLATE.format(params=params)
+    meta = package_manager.parse_tool_meta(content)
+    assert meta == package_manager.parse_tool_meta_ast(content)
+    assert meta["valves"] == ["priority", "label"]
+    assert meta["description"] == "Launches a test applet"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        # A helper's run, defined before Tools
+        """
+class Helper:
+    def run(self, job: str):
+        pass
+
+
+""" + TOOL_TEMPLATE.format(params="self"),
+        # A Valves class nested in a later, unrelated class
+        TOOL_TEMPLATE.replace(
+            "    class Valves(BaseModel):", "    class Options:"
+        ).format(params="self")
+        + """
+
+class Other:
+    class Valves(BaseModel):
+        other: int = 0
+""",
+        # run and Valves of a class nested in Tools
+        TOOL_TEMPLATE.format(params="self") + """
+    class Worker:
+        class Valves(BaseModel):
+            other: int = 0
+
+        def run(self, job: str):
+            pass
+""",
+        # Escapes in the docstring
+        TOOL_TEMPLATE.replace(
+            "Launches a test applet", 'Launches a \\"test\\"\\tapplet\\\\'
+        ).format(params="self"),
+    ],
+    ids=["helper_run", "later_valves", "nested_class", "docstring_escapes"],
+)
+def test_meta_outside_the_tools_body_matches_ast(package_manager, content):
+    assert package_manager.parse_tool_meta(
+        content
+    ) == package_manager.parse_tool_meta_ast(content)
+
+
+def test_stale_cached_meta_is_parsed_again(package_manager):
+    package_manager.user_id = "u1"
+    content = TOOL_TEMPLATE.format(params="self, body: dict, x=dict(a=1), y: int = 2")
+    meta = package_manager.get_tool_meta(content)
+    stale = {key: value for key, value in meta.items() if key != "parser"}
+    stale["run_params"] = ["self", "body"]
+    package_manager.index.set_package("u1", "test", {}, tool_meta=stale)
+
+    assert package_manager.get_tool_meta(content)["run_params"] == [
+        "self",
+        "body",
+        "x",
+        "y",
+    ]
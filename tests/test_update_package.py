@@ -0,0 +1,186 @@
+import asyncio
+import os
+import shutil
+import sys
+import types
+
+import pytest
+
+from conftest import FILES, ROOT_DIR, cerebro
+
+USER = {"id": "test-user"}
+
+
+@pytest.fixture
+def repo_dir(tmp_path):
+    shutil.copytree(
+        os.path.join(ROOT_DIR, "plugins", "snake"),
+        tmp_path / "plugins" / "snake",
+        ignore=shutil.ignore_patterns("__pycache__"),
+    )
+    os.makedirs(tmp_path / "src")
+    shutil.copy(os.path.join(ROOT_DIR, "src", "cerebro_applet.py"), tmp_path / "src")
+    return tmp_path
+
+
+@pytest.fixture
+def command(package_manager, repo_dir):
+    package_manager.valves.package_repo_url = f"file://{repo_dir / 'plugins'}"
+    # Archives are otherwise reused for a while, and the tests change the repository
+    package_manager.valves.archive_cache_ttl = 0
+
+    def run(text: str) -> str:
+        asyncio.run(
+            package_manager.inlet(
+                {"messages": [{"role": "user", "content": text}]}, USER
+            )
+        )
+        reply = {
+            "messages": [
+                {"role": "user", "content": text},
+                {"role": "assistant", "content": ""},
+            ]
+        }
+        package_manager.outlet(reply, USER)
+        return reply["messages"][-1]["content"]
+
+    return run
+
+
+def package_record(package_manager) -> dict:
+    return package_manager.index.get_record(USER["id"], "snake")
+
+
+def test_update_rewrites_only_changed_files(package_manager, repo_dir, command):
+    assert "Package Installed" in command("owui install snake")
+    installed = package_record(package_manager)
+    assert set(installed["files"]) == {
+        "snake_capp.html",
+        "snake_capp.py",
+        "app.js",
+        "style.css",
+    }
+
+    assert "Package Already Up To Date" in command("owui update snake")
+    assert package_record(package_manager)["sources"] == installed["sources"]
+
+    with open(repo_dir / "plugins" / "snake" / "app.js", "a", encoding="utf-8") as f:
+        f.write("\n// changed\n")
+    assert "Package Updated Successfully" in command("owui update snake")
+
+    updated = package_record(package_manager)
+    # File IDs are kept so existing embeds keep working
+    assert updated["files"] == installed["files"]
+    assert updated["sources"]["style.css"] == installed["sources"]["style.css"]
+    assert (
+        updated["sources"]["app.js"]["sha256"]
+        != installed["sources"]["app.js"]["sha256"]
+    )
+    app_js = FILES.get_file_by_id(updated["files"]["app.js"])
+    assert app_js.meta["path"] == package_manager.blobs.path(
+        updated["sources"]["app.js"]["blob"]
+    )
+    with open(app_js.meta["path"], encoding="utf-8") as f:
+        assert f.read().endswith("// changed\n")
+    # The old content is no longer referenced by anything
+    assert not os.path.exists(
+        package_manager.blobs.path(installed["sources"]["app.js"]["blob"])
+    )
+
+
+def test_uninstall_removes_files_and_blobs(package_manager, command):
+    command("owui install snake")
+    installed = package_record(package_manager)
+
+    command("owui uninstall snake")
+
+    assert package_record(package_manager) is None
+    for file_id in installed["files"].values():
+        assert FILES.get_file_by_id(file_id) is None
+    for source in installed["sources"].values():
+        assert not os.path.exists(package_manager.blobs.path(source["blob"]))
+    assert "Package Not Installed" in command("owui update snake")
+
+
+def test_failed_runtime_notification_keeps_the_install(
+    package_manager, command, monkeypatch
+):
+    runtime = types.ModuleType("cerebro_applet")
+
+    def package_installed(*args):
+        raise RuntimeError("registry unavailable")
+
+    runtime.package_installed = package_installed
+    monkeypatch.setitem(sys.modules, "cerebro_applet", runtime)
+
+    assert "Package Installed" in command("owui install snake")
+    assert package_record(package_manager) is not None
+
+
+def test_failed_update_leaves_files_as_they_were(
+    package_manager, repo_dir, command, monkeypatch
+):
+    command("owui install snake")
+    installed = package_record(package_manager)
+    rows = {
+        file_id: FILES.get_file_by_id(file_id)
+        for file_id in installed["files"].values()
+    }
+
+    package_dir = repo_dir / "plugins" / "snake"
+    (package_dir / "extra.js").write_text("console.log(1)\n", encoding="utf-8")
+    with open(package_dir / "app.js", "a", encoding="utf-8") as f:
+        f.write("\n// changed\n")
+
+    insert_new_file = FILES.insert_new_file
+    failures = [installed["files"]["app.js"]]
+
+    # Fail the update of app.js once, after extra.js has been inserted
+    def failing_insert(user_id, form_data):
+        if form_data.id in failures:
+            failures.remove(form_data.id)
+            return None
+        return insert_new_file(user_id, form_data)
+
+    monkeypatch.setattr(FILES, "insert_new_file", failing_insert)
+    with pytest.raises(Exception):
+        command("owui update snake")
+    monkeypatch.undo()
+
+    assert package_record(package_manager) == installed
+    assert {file.id for file in FILES.get_files()} == set(rows)
+    for file_id, row in rows.items():
+        file = FILES.get_file_by_id(file_id)
+        assert (file.filename, file.meta) == (row.filename, row.meta)
+        assert os.path.exists(file.meta["path"])
+
+
+def test_runtime_is_only_required_by_tools_that_import_it(
+    package_manager, repo_dir, command
+):
+    shutil.rmtree(repo_dir / "src")
+    package_dir = repo_dir / "plugins" / "plain"
+    os.makedirs(package_dir)
+    (package_dir / "plain_capp.py").write_text(
+        'class Tools:\n    """\n    Says hello\n    """\n\n'
+        '    async def run(self) -> str:\n        return "hello"\n',
+        encoding="utf-8",
+    )
+
+    with pytest.raises(Exception, match="Applet runtime"):
+        command("owui install snake")
+    assert package_record(package_manager) is None
+    assert "Package Installed" in command("owui install plain")
+    assert package_manager.index.get_record(USER["id"], "plain") is not None
+
+
+def test_first_install_is_measured(upload_dir, command):
+    command("owui install snake")
+
+    with open(
+        os.path.join(upload_dir, "cerebro", "metrics", "package_manager.prom"),
+        encoding="utf-8",
+    ) as f:
+        exported = f.read()
+    for stage in ("download", "extract", "register"):
+        assert f'stage="{stage}"' in exported